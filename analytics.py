@@ -0,0 +1,351 @@
+"""
+Rarity and reprint statistics over the whole catalog.
+
+``CardStats`` holds the columns the analyses need as dictionary-encoded
+arrays: each distinct value stored once, each card a small integer code
+(one byte when a column has at most 256 values).  Queries run as whole-column
+passes in C rather than per-card Python:
+
+- filters become byte masks, by ``bytes.translate`` through a per-value
+  table, combined with big-integer AND
+- counts are one ``Counter`` over ``zip``/``compress`` of the code arrays
+
+The columns and the last ``MAX_RESULTS`` answered queries are cached next to
+the database (``pokemon_cards.db.stats``), validated like the catalog
+snapshot, so repeat queries are a dict lookup and a fresh process loads in
+milliseconds.
+
+    python analytics.py [--db pokemon_cards.db] [--by set_name|series|regulation|card_type|year]
+                        [--regulation g,h,i] [--type pokemon] [--since 2023-01-01] [--until 2024-12-31]
+                        [--reprints 20] [--json]
+"""
+import argparse
+import json
+import marshal
+import os
+import sqlite3
+import struct
+import sys
+import time
+from array import array
+from collections import Counter
+from itertools import compress
+
+from database import connect_reader, wal_state
+from printing_rules import RARITIES_ORDER
+from schema import SCHEMA_VERSION, UNDATED, release_key, table_columns
+from snapshot import file_hash
+
+DB_PATH = "pokemon_cards.db"
+
+MAGIC = b"TCGSTAT\0"
+STATS_VERSION = 2
+_LENGTH = struct.Struct("<I")
+
+COLUMNS = ("name", "set_name", "series", "regulation", "rarity", "card_type", "identity", "year", "date")
+GROUP_BY = ("set_name", "series", "regulation", "card_type", "year", "rarity")
+
+# columns read as they are; ``year`` and ``date`` come from ``released``
+TEXT_COLUMNS = ("name", "set_name", "series", "regulation", "rarity", "card_type", "identity")
+
+# answered queries kept in the cache file, oldest dropped first
+MAX_RESULTS = 256
+
+
+def stats_path(db_path: str) -> str:
+    return db_path + ".stats"
+
+
+def date_code(value) -> int:
+    """``YYYYMMDD`` as an int, from an int or a ``YYYY[-MM[-DD]]`` string; 0 for none."""
+    if value is None or value == "":
+        return 0
+    if isinstance(value, int):
+        return value
+    parts = str(value).split("-")
+    if len(parts) > 3 or not all(p.isdigit() for p in parts):
+        raise ValueError(f"not a date: {value!r}")
+    year, month, day = (list(map(int, parts)) + [1, 1])[:3]
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        raise ValueError(f"not a date: {value!r}")
+    return year * 10000 + month * 100 + day
+
+
+class Column:
+    """A dictionary-encoded column: ``values[codes[i]]`` is row i's value."""
+
+    __slots__ = ("values", "codes")
+
+    def __init__(self, values: list, codes: array):
+        self.values = values
+        self.codes = codes
+
+    @classmethod
+    def encode(cls, raw) -> "Column":
+        index: dict = {}
+        codes = [index.setdefault(v, len(index)) for v in raw]
+        typecode = "B" if len(index) <= 0x100 else "I"
+        return cls(list(index), array(typecode, codes))
+
+    def mask(self, keep) -> bytes:
+        """One byte per row, 1 where ``keep(value)``."""
+        table = bytes(1 if keep(v) else 0 for v in self.values)
+        if self.codes.typecode == "B":
+            return self.codes.tobytes().translate(table.ljust(0x100, b"\0"))
+        return bytes(map(table.__getitem__, self.codes))
+
+    def dump(self) -> tuple:
+        return self.values, self.codes.typecode, self.codes.tobytes()
+
+    @classmethod
+    def load(cls, dumped: tuple) -> "Column":
+        values, typecode, data = dumped
+        codes = array(typecode)
+        codes.frombytes(data)
+        return cls(values, codes)
+
+
+def _and(masks: list[bytes], length: int) -> bytes | None:
+    if not masks:
+        return None
+    combined = int.from_bytes(masks[0], "little")
+    for m in masks[1:]:
+        combined &= int.from_bytes(m, "little")
+    return combined.to_bytes(length, "little")
+
+
+def _rarity_order(rarity) -> tuple:
+    return (RARITIES_ORDER.index(rarity) if rarity in RARITIES_ORDER else len(RARITIES_ORDER), str(rarity))
+
+
+class CardStats:
+    def __init__(self, columns: dict[str, Column], results: dict | None = None):
+        self.columns = columns
+        self.length = len(columns["rarity"].codes)
+        # query key -> answer; saved with the columns
+        self.results = results if results is not None else {}
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return self.length
+
+    @classmethod
+    def from_connection(cls, conn: sqlite3.Connection) -> "CardStats":
+        # columns the export dropped (all null) read as NULL, as in catalog.py
+        present = set(table_columns(conn))
+        select = ", ".join(col if col in present else "NULL" for col in TEXT_COLUMNS)
+        migrated = "released" in present
+        released = "released" if migrated else "date"
+        rows = conn.execute(f"SELECT {select}, {released} FROM cards ORDER BY rowid").fetchall()
+        *raw, released = list(zip(*rows)) if rows else [()] * (len(TEXT_COLUMNS) + 1)
+        if not migrated:
+            # not migrated to schema version 5 yet
+            released = map(release_key, released)
+        dates = [None if r is None or r == UNDATED else r for r in released]
+        years = [None if d is None else d // 10000 for d in dates]
+        return cls({name: Column.encode(values) for name, values in zip(COLUMNS, (*raw, years, dates))})
+
+    @classmethod
+    def load(cls, db_path: str = DB_PATH) -> "CardStats":
+        conn = connect_reader(db_path)
+        try:
+            return cls.from_connection(conn)
+        finally:
+            conn.close()
+
+    def _mask(self, regulations=None, card_types=None, since=None, until=None) -> bytes | None:
+        masks = []
+        if regulations:
+            wanted = {r.lower() for r in regulations}
+            masks.append(self.columns["regulation"].mask(wanted.__contains__))
+        if card_types:
+            wanted = {t.lower() for t in card_types}
+            masks.append(self.columns["card_type"].mask(wanted.__contains__))
+        if since or until:
+            low, high = date_code(since) or 0, date_code(until) or 99999999
+            masks.append(self.columns["date"].mask(lambda d: d is not None and low <= d <= high))
+        return _and(masks, self.length)
+
+    def _cached(self, key: tuple, compute):
+        if key not in self.results:
+            self.results[key] = compute()
+            self.dirty = True
+            while len(self.results) > MAX_RESULTS:
+                del self.results[next(iter(self.results))]
+        return self.results[key]
+
+    def crosstab(self, by: str = "set_name", regulations=None, card_types=None, since=None, until=None) -> dict:
+        """``{group: {rarity: cards}}`` for the cards passing the filters, grouped by a ``GROUP_BY`` column."""
+        if by not in GROUP_BY:
+            raise ValueError(f"cannot group by {by!r}; expected one of {', '.join(GROUP_BY)}")
+        filters = (tuple(sorted(regulations or ())), tuple(sorted(card_types or ())),
+                   date_code(since), date_code(until))
+
+        def compute():
+            group, rarity = self.columns[by], self.columns["rarity"]
+            pairs = zip(group.codes, rarity.codes)
+            mask = self._mask(*filters)
+            counts = Counter(pairs if mask is None else compress(pairs, mask))
+            table: dict = {}
+            for (g, r), n in counts.items():
+                table.setdefault(group.values[g], {})[rarity.values[r]] = n
+            return {g: dict(sorted(row.items(), key=lambda item: _rarity_order(item[0]))) for g, row in table.items()}
+
+        return self._cached(("crosstab", by, *filters), compute)
+
+    def rarity_distribution(self, regulations=None, card_types=None, since=None, until=None) -> dict:
+        """``{rarity: cards}`` over the cards passing the filters."""
+        totals = Counter()
+        for row in self.crosstab("rarity", regulations, card_types, since, until).values():
+            totals.update(row)
+        return dict(sorted(totals.items(), key=lambda item: _rarity_order(item[0])))
+
+    def reprints(self) -> dict:
+        """``{functional identity: printings}``, see schema.functional_identity."""
+        def compute():
+            identity = self.columns["identity"]
+            return {identity.values[code]: n for code, n in Counter(identity.codes).items()}
+
+        return self._cached(("reprints",), compute)
+
+    def most_reprinted(self, limit: int = 20) -> list[tuple[str, int]]:
+        """The ``limit`` functional cards with the most printings, as ``(name, printings)``."""
+        counts = self.reprints()
+        top = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+        identity, name = self.columns["identity"], self.columns["name"]
+        first_name = {}
+        wanted = {ident for ident, _ in top}
+        for i, code in enumerate(identity.codes):
+            value = identity.values[code]
+            if value in wanted and value not in first_name:
+                first_name[value] = name.values[name.codes[i]]
+        return [(first_name[ident], n) for ident, n in top]
+
+    def dump(self) -> dict:
+        return {
+            "columns": {name: col.dump() for name, col in self.columns.items()},
+            "results": self.results,
+        }
+
+    @classmethod
+    def from_dump(cls, body: dict) -> "CardStats":
+        return cls({name: Column.load(col) for name, col in body["columns"].items()}, body["results"])
+
+
+def _source_meta(db_path: str) -> dict:
+    st = os.stat(db_path)
+    return {
+        "stats_version": STATS_VERSION,
+        "schema_version": SCHEMA_VERSION,
+        "columns": COLUMNS,
+        "db_size": st.st_size,
+        "db_mtime_ns": st.st_mtime_ns,
+        "db_hash": file_hash(db_path),
+        "wal": wal_state(db_path),
+    }
+
+
+def is_current(meta: dict, db_path: str) -> bool:
+    """Do the cached stats described by ``meta`` still match the database on disk?"""
+    if (meta.get("stats_version") != STATS_VERSION
+            or meta.get("schema_version") != SCHEMA_VERSION
+            or tuple(meta.get("columns", ())) != COLUMNS):
+        return False
+    st = os.stat(db_path)
+    if st.st_size != meta["db_size"] or wal_state(db_path) != meta.get("wal"):
+        return False
+    if st.st_mtime_ns == meta["db_mtime_ns"]:
+        return True
+    return file_hash(db_path) == meta["db_hash"]
+
+
+def write_stats(stats: CardStats, db_path: str = DB_PATH, path: str | None = None) -> str:
+    path = path or stats_path(db_path)
+    meta = marshal.dumps(_source_meta(db_path))
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(_LENGTH.pack(len(meta)))
+        f.write(meta)
+        f.write(marshal.dumps(stats.dump()))
+    os.replace(tmp, path)
+    stats.dirty = False
+    return path
+
+
+def read_stats(db_path: str = DB_PATH, path: str | None = None) -> CardStats | None:
+    """Load the cached stats for ``db_path``, or return None if they are missing or stale."""
+    path = path or stats_path(db_path)
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+            if not is_current(marshal.loads(f.read(length)), db_path):
+                return None
+            return CardStats.from_dump(marshal.loads(f.read()))
+    except (OSError, EOFError, ValueError, KeyError, struct.error):
+        return None
+
+
+def load_stats(db_path: str = DB_PATH) -> CardStats:
+    """Stats from the cache file if it is current, otherwise from the database."""
+    stats = read_stats(db_path)
+    return stats if stats is not None else CardStats.load(db_path)
+
+
+def save_stats(stats: CardStats, db_path: str = DB_PATH) -> None:
+    """Write ``stats`` back if it answered new queries (or was just loaded from the database)."""
+    if not stats.dirty and os.path.exists(stats_path(db_path)):
+        return
+    try:
+        write_stats(stats, db_path)
+    except OSError as e:
+        sys.stderr.write(f"Warning: could not write stats cache: {e}\n")
+
+
+def _date_arg(text: str) -> int:
+    try:
+        return date_code(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a date YYYY[-MM[-DD]], got {text!r}") from None
+
+
+def _split(value: str | None) -> list[str] | None:
+    return [v.strip() for v in value.split(",") if v.strip()] if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rarity and reprint statistics")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--by", choices=GROUP_BY, default="set_name")
+    parser.add_argument("--regulation", help="comma-separated regulation marks, e.g. g,h,i")
+    parser.add_argument("--type", help="comma-separated card types, e.g. pokemon,supporter")
+    parser.add_argument("--since", type=_date_arg, help="first release date, YYYY[-MM[-DD]]")
+    parser.add_argument("--until", type=_date_arg, help="last release date, YYYY[-MM[-DD]]")
+    parser.add_argument("--reprints", type=int, metavar="N", help="also list the N most reprinted cards")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = load_stats(args.db)
+    loaded = time.perf_counter()
+    table = stats.crosstab(args.by, _split(args.regulation), _split(args.type), args.since, args.until)
+    top = stats.most_reprinted(args.reprints) if args.reprints else []
+    answered = time.perf_counter()
+    save_stats(stats, args.db)
+
+    if args.json:
+        print(json.dumps({"by": args.by, "crosstab": table, "most_reprinted": top}, default=str))
+        return
+    for group in sorted(table, key=str):
+        row = table[group]
+        print(f"{group} ({sum(row.values())}): " + ", ".join(f"{rarity} {n}" for rarity, n in row.items()))
+    for name, n in top:
+        print(f"{n:4d}  {name}")
+    print(f"{len(stats)} cards; loaded in {(loaded - start) * 1000:.0f} ms, "
+          f"answered in {(answered - loaded) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Benchmarks for the hot paths, on a synthetic catalog.
+
+Builds (once, then reuses) a deterministic ``synthetic.py`` database of
+``--rows`` cards and a corpus of ``--decks`` decklists sampled from it, then
+times:
+
+- ``parse_decklist`` over every decklist
+- ``fetch_printing`` and ``fetch_related`` for every printing in the corpus,
+  bypassing the lookup cache
+- ``select_preferred_printing`` for every printing and its reprints, and
+  ``choose_many`` over the same groups
+- ``interpret.compile_deck`` for every deck's answer dict, cache cleared
+- ``short.fetch_cards`` and ``short.write_cards_txt`` (no line cache)
+
+Each benchmark reports its best of ``--repeat`` runs, as seconds and µs per
+operation.  Results are written as JSON; ``--compare`` checks them against an
+earlier run's and exits with status 1 if any got slower by more than
+``--tolerance``.
+
+    python bench.py [--rows 10000] [--decks 200] [--seed 1] [--repeat 3]
+                    [--dir bench_data] [--out bench.json] [--compare baseline.json] [--tolerance 0.2]
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import time
+from typing import Callable
+
+import interpret
+import short
+import synthetic
+from cache import LOOKUP_CACHE
+from decklist import parse_decklist
+from lookup import fetch_printing, fetch_related
+from printing_rules import choose_many, select_preferred_printing
+from schema import SCHEMA_VERSION, migrate
+
+
+def bench_db(data_dir: str, rows: int, seed: int) -> str:
+    """The synthetic database for ``rows``/``seed``, built on first use."""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"cards_v{synthetic.VERSION}_{rows}_{seed}.db")
+    if not os.path.exists(path):
+        start = time.perf_counter()
+        synthetic.build_db(path + ".tmp", rows, seed)
+        os.replace(path + ".tmp", path)
+        sys.stderr.write(f"Built {path} in {time.perf_counter() - start:.1f}s\n")
+        return path
+    conn = sqlite3.connect(path)
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            migrate(conn)
+    finally:
+        conn.close()
+    return path
+
+
+def measure(fn: Callable[[], object], repeat: int, setup: Callable[[], object] | None = None) -> dict:
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"seconds": min(times), "median": statistics.median(times)}
+
+
+def run(db_path: str, decks: list[dict], repeat: int, out_dir: str) -> dict:
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+    texts = [deck["decklist"].splitlines() for deck in decks]
+    entries = list({(e.set_code, e.number): e for text in texts for e in parse_decklist(text)[0]}.values())
+    printings = [fetch_printing.uncached(cur, e.set_code, e.number) for e in entries]
+    printings = [row for row in printings if row is not None]
+    groups = [(row, fetch_related.uncached(cur, row)) for row in printings]
+    related_groups = [related for _, related in groups]
+    sheet_path = os.path.join(out_dir, "cards.txt")
+
+    benchmarks = {
+        "parse_decklist": (len(texts), lambda: [parse_decklist(text) for text in texts], None),
+        "fetch_printing": (len(entries), lambda: [fetch_printing.uncached(cur, e.set_code, e.number)
+                                                  for e in entries], None),
+        "fetch_related": (len(printings), lambda: [fetch_related.uncached(cur, row) for row in printings], None),
+        "select_preferred_printing": (len(groups), lambda: [select_preferred_printing(row["card_type"], row, related)
+                                                            for row, related in groups], None),
+        "choose_many": (len(groups), lambda: choose_many(related_groups), None),
+        "compile_deck": (len(decks), lambda: [interpret.compile_deck(deck["dict"], cursor=cur) for deck in decks],
+                         LOOKUP_CACHE.invalidate),
+        "fetch_cards": (1, lambda: short.fetch_cards(db_path), None),
+    }
+    results = {}
+    try:
+        for name, (ops, fn, setup) in benchmarks.items():
+            results[name] = {"ops": ops, **measure(fn, repeat, setup)}
+        cards = short.fetch_cards(db_path)
+        results["write_cards_txt"] = {"ops": len(cards),
+                                      **measure(lambda: short.write_cards_txt(cards, sheet_path), repeat)}
+    finally:
+        conn.close()
+    for result in results.values():
+        result["us_per_op"] = result["seconds"] / result["ops"] * 1e6 if result["ops"] else 0.0
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Benchmarks slower than in ``baseline`` by more than ``tolerance``, described."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not before.get("us_per_op"):
+            continue
+        ratio = result["us_per_op"] / before["us_per_op"]
+        result["ratio"] = ratio
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: {before['us_per_op']:.1f} -> {result['us_per_op']:.1f} µs/op ({ratio:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lookups, deck compilation and the card sheet")
+    parser.add_argument("--rows", type=int, default=10000, help="synthetic cards (10k to 1M)")
+    parser.add_argument("--decks", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dir", default="bench_data", help="where the synthetic databases and outputs are kept")
+    parser.add_argument("--out", default="bench.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="an earlier --out file to check against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown, as a fraction")
+    args = parser.parse_args()
+
+    db_path = bench_db(args.dir, args.rows, args.seed)
+    conn = sqlite3.connect(db_path)
+    decks = synthetic.decklists(conn, args.decks, args.seed)
+    conn.close()
+
+    results = run(db_path, decks, args.repeat, args.dir)
+    report = {
+        "meta": {
+            "rows": args.rows, "decks": args.decks, "seed": args.seed, "repeat": args.repeat,
+            "synthetic_version": synthetic.VERSION, "schema_version": SCHEMA_VERSION,
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if (baseline["meta"]["rows"], baseline["meta"]["decks"]) != (args.rows, args.decks):
+            sys.stderr.write("Warning: the baseline was run with different --rows/--decks\n")
+        regressions = compare(results, baseline["results"], args.tolerance)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for name, r in results.items():
+        ratio = f"  {r['ratio']:.2f}x" if "ratio" in r else ""
+        print(f"{name:26s} {r['ops']:7d} ops  {r['seconds'] * 1000:9.1f} ms  {r['us_per_op']:10.1f} µs/op{ratio}")
+    print(f"Wrote {args.out}")
+    if regressions:
+        print("Regressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Memoized card lookups.
+
+``lookup.fetch_printing``/``fetch_related``/``fetch_preferred`` and
+``interpret.lookup_card`` answer the same few hundred staple cards over and
+over.  ``memoized`` wraps them in a shared ``LookupCache``: a thread-safe LRU
+with an optional TTL, keyed on the function and its normalized arguments.
+
+Entries are tied to the database file they came from, identified by its path,
+size and mtime (and those of its ``-wal`` file).  The file is re-checked at
+most every ``check_interval`` seconds, so after an ingest rebuilds the
+database, every cached answer for it is dropped on first use.  In-memory
+databases and ``CardCatalog`` lookups bypass the cache.
+
+``LOOKUP_CACHE.stats()`` reports hits, misses, evictions and expirations for
+sizing ``maxsize``/``ttl``, and hits and misses per memoized function (also
+served by ``service.py`` at ``GET /stats``).
+"""
+import functools
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from database import signature
+
+_MISSING = object()
+
+
+class LookupCache:
+    def __init__(self, maxsize: int = 4096, ttl: float | None = None, check_interval: float = 1.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        # db path -> (file signature, when it was last checked)
+        self._signatures: dict[str, tuple[tuple, float]] = {}
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+        # memoized function -> [hits, misses]
+        self.calls: dict[str, list[int]] = {}
+
+    def configure(self, maxsize: int | None = None, ttl: float | None = _MISSING) -> None:
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not _MISSING:
+                self.ttl = ttl
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key: Hashable) -> Any:
+        """The cached value for ``key``, or ``_MISSING``."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return _MISSING
+            expires, value = entry
+            if expires and expires < now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def count(self, name: str, hit: bool) -> None:
+        with self._lock:
+            counts = self.calls.setdefault(name, [0, 0])
+            counts[0 if hit else 1] += 1
+
+    def put(self, key: Hashable, value: Any) -> None:
+        expires = time.monotonic() + self.ttl if self.ttl else 0.0
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, db_path: str | None = None) -> None:
+        """Drop the entries for ``db_path`` (default: everything)."""
+        with self._lock:
+            self._drop(db_path)
+
+    def _drop(self, db_path: str | None) -> None:
+        # callers hold self._lock
+        if db_path is None:
+            self._entries.clear()
+            self._signatures.clear()
+        else:
+            for key in [k for k in self._entries if k[0] == db_path]:
+                del self._entries[key]
+            self._signatures.pop(db_path, None)
+        self.invalidations += 1
+
+    def generation(self, db_path: str) -> tuple:
+        """
+        Signature of the database file, part of every cache key: a rebuilt
+        database gets new keys and its stale entries age out of the LRU.
+        """
+        now = time.monotonic()
+        with self._lock:
+            known = self._signatures.get(db_path)
+        if known is not None and now - known[1] < self.check_interval:
+            return known[0]
+        current = signature(db_path)
+        with self._lock:
+            known = self._signatures.get(db_path)
+            if known is not None and known[0] != current:
+                self._drop(db_path)
+            self._signatures[db_path] = (current, now)
+        return current
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "functions": {name: {"hits": h, "misses": m} for name, (h, m) in self.calls.items()},
+        }
+
+
+LOOKUP_CACHE = LookupCache()
+
+
+def database_path(cur: sqlite3.Cursor) -> str:
+    """File behind the cursor's main database, or '' for an in-memory one."""
+    for _, name, path in cur.connection.execute("PRAGMA database_list"):
+        if name == "main":
+            return path
+    return ""
+
+
+# cursor's connection -> database_path(); plain sqlite3 connections take no weak
+# references, so for those the cursor is the key (one PRAGMA per cursor)
+_PATHS: "weakref.WeakKeyDictionary[object, str]" = weakref.WeakKeyDictionary()
+
+
+def _connection_path(cur: sqlite3.Cursor) -> str:
+    """``database_path(cur)``, run once per connection (or cursor) rather than on every lookup."""
+    conn = cur.connection
+    owner = cur if type(conn) is sqlite3.Connection else conn
+    try:
+        return _PATHS[owner]
+    except KeyError:
+        path = _PATHS[owner] = database_path(cur)
+        return path
+
+
+def memoized(key: Callable[..., Hashable], cache: LookupCache = LOOKUP_CACHE):
+    """
+    Cache a ``fn(cur, *args)`` lookup in ``cache`` under ``key(*args)``, which
+    should normalize the arguments the way the query does.  ``cur`` values that
+    are not sqlite3 cursors (a ``CardCatalog``) are passed straight through.
+    """
+    def decorator(fn):
+        name = fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(cur, *args):
+            if not isinstance(cur, sqlite3.Cursor):
+                return fn(cur, *args)
+            db_path = _connection_path(cur)
+            if not db_path:
+                return fn(cur, *args)
+            cache_key = (db_path, cache.generation(db_path), name, cur.row_factory, key(*args))
+            cached = cache.get(cache_key)
+            cache.count(name, cached is not _MISSING)
+            if cached is _MISSING:
+                value = fn(cur, *args)
+                # lists are stored frozen and handed out as copies, so callers can't change the cached one
+                is_list = isinstance(value, list)
+                cache.put(cache_key, (is_list, tuple(value) if is_list else value))
+                return value
+            is_list, value = cached
+            return list(value) if is_list else value
+
+        wrapper.uncached = fn
+        return wrapper
+    return decorator
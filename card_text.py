@@ -0,0 +1,167 @@
+"""
+Typed access to card attacks and abilities.
+
+The ingest stores ``attacks``/``abilities`` as lower-cased Python reprs of the
+upstream JSON lists.  Because the curly apostrophe is straightened *after* the
+repr is taken, the strings are not valid literals (``'opponent's'``), so they
+are parsed here once, by ``schema.migrate``, into the ``card_attacks`` and
+``card_abilities`` tables.  Scripts read those tables through ``attacks_for`` /
+``abilities_for`` instead of picking the strings apart.
+"""
+import re
+import sqlite3
+from typing import Any, Iterable, NamedTuple
+
+
+class Attack(NamedTuple):
+    position: int
+    name: str
+    cost: tuple[str, ...]
+    damage: str | None      # amount and suffix, e.g. '30+'
+    effect: str | None
+
+
+class Ability(NamedTuple):
+    position: int
+    kind: str | None        # 'ability', 'poke-power', ...
+    name: str
+    effect: str | None
+
+
+_BARE = {"none": None, "true": True, "false": False}
+_ESCAPE_RE = re.compile(r"\\(.)")
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r"}
+_VALUE_START = set("'\"[{-0123456789")
+
+
+def _closes(s: str, k: int) -> bool:
+    """Is the quote at ``s[k]`` the end of a string rather than an apostrophe?"""
+    rest = s[k + 1:].lstrip(" ")
+    if not rest or rest[0] in "]}:":
+        return True
+    if rest[0] != ",":
+        return False
+    after = rest[1:].lstrip(" ")
+    return not after or after[0] in _VALUE_START or after.startswith(tuple(_BARE))
+
+
+def _parse(s: str, i: int) -> tuple[Any, int]:
+    while s[i] == " ":
+        i += 1
+    c = s[i]
+
+    if c in "[{":
+        close = "]" if c == "[" else "}"
+        items, i = [], i + 1
+        while True:
+            while s[i] in ", ":
+                i += 1
+            if s[i] == close:
+                break
+            value, i = _parse(s, i)
+            if c == "{":
+                while s[i] in ": ":
+                    i += 1
+                item, i = _parse(s, i)
+                value = (value, item)
+            items.append(value)
+        return (items if c == "[" else dict(items)), i + 1
+
+    if c in "'\"":
+        k = i + 1
+        while True:
+            if s[k] == "\\":
+                k += 2
+                continue
+            if s[k] == c and _closes(s, k):
+                break
+            k += 1
+        text = _ESCAPE_RE.sub(lambda m: _ESCAPES.get(m.group(1), m.group(1)), s[i + 1:k])
+        return text, k + 1
+
+    k = i
+    while k < len(s) and s[k] not in ",:]}":
+        k += 1
+    token = s[i:k].strip()
+    if token in _BARE:
+        return _BARE[token], k
+    try:
+        return int(token), k
+    except ValueError:
+        return token, k
+
+
+def parse_repr(raw: str | None) -> Any:
+    """Parse a stored list/dict repr, or return None for a null column."""
+    if raw is None or raw.strip() in ("", "none"):
+        return None
+    return _parse(raw.strip(), 0)[0]
+
+
+def _damage(value: Any) -> str | None:
+    if isinstance(value, dict):
+        amount = value.get("amount")
+        if amount is None:
+            return None
+        return f"{amount}{value.get('suffix') or ''}"
+    return None if value is None else str(value)
+
+
+def parse_attacks(raw: str | None) -> list[Attack]:
+    return [
+        Attack(pos, a.get("name") or "", tuple(a.get("cost") or ()), _damage(a.get("damage")), a.get("effect"))
+        for pos, a in enumerate(parse_repr(raw) or [])
+    ]
+
+
+def parse_abilities(raw: str | None) -> list[Ability]:
+    return [
+        Ability(pos, a.get("type"), a.get("name") or "", a.get("effect"))
+        for pos, a in enumerate(parse_repr(raw) or [])
+    ]
+
+
+def _chunks(ids: list[int], size: int = 500) -> Iterable[list[int]]:
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _in_clause(chunk: list[int] | None) -> str:
+    return "" if chunk is None else f"WHERE card_id IN ({', '.join('?' * len(chunk))})"
+
+
+def attacks_for(cur: sqlite3.Cursor, card_ids: Iterable[int] | None = None) -> dict[int, list[Attack]]:
+    """Return ``{card_id: [Attack, ...]}`` in printed order for the given cards (default: all)."""
+    result: dict[int, list[Attack]] = {}
+    for chunk in _chunks(list(card_ids)) if card_ids is not None else [None]:
+        cur.execute(
+            f"""
+            SELECT card_id, position, name, cost, damage, effect
+            FROM card_attacks
+            {_in_clause(chunk)}
+            ORDER BY card_id, position
+            """,
+            chunk or (),
+        )
+        for card_id, position, name, cost, damage, effect in cur.fetchall():
+            cost = tuple(cost.split(",")) if cost else ()
+            result.setdefault(card_id, []).append(Attack(position, name, cost, damage, effect))
+    return result
+
+
+def abilities_for(cur: sqlite3.Cursor, card_ids: Iterable[int] | None = None) -> dict[int, list[Ability]]:
+    """Return ``{card_id: [Ability, ...]}`` in printed order for the given cards (default: all)."""
+    result: dict[int, list[Ability]] = {}
+    for chunk in _chunks(list(card_ids)) if card_ids is not None else [None]:
+        cur.execute(
+            f"""
+            SELECT card_id, position, kind, name, effect
+            FROM card_abilities
+            {_in_clause(chunk)}
+            ORDER BY card_id, position
+            """,
+            chunk or (),
+        )
+        for card_id, position, kind, name, effect in cur.fetchall():
+            result.setdefault(card_id, []).append(Ability(position, kind, name, effect))
+    return result
@@ -0,0 +1,168 @@
+"""
+In-memory card catalog.
+
+For read-only work such as resolving decklists, ``CardCatalog`` loads the
+``cards`` table once into ``__slots__`` records and answers lookups from dict
+indexes, with no SQL at lookup time.  ``lookup.fetch_printing``/``fetch_related``/
+``fetch_preferred``/``resolve_entries``, ``interpret.lookup_card`` and
+``short.fetch_cards`` accept a catalog wherever they take a cursor.
+
+    python catalog.py [pokemon_cards.db]    # load time and memory per card
+"""
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+from card_text import Ability, Attack, abilities_for, attacks_for
+from database import connect_reader
+from printing_rules import choose
+from schema import normalize_key, normalize_number, release_key, table_columns
+
+DB_PATH = "pokemon_cards.db"
+
+# columns copied from the cards table; missing ones (the notebook drops
+# all-null columns) load as None
+COLUMNS = (
+    "set_name", "number", "name", "card_type", "types", "hp", "evolve_from",
+    "rarity", "effect", "vstar_power", "retreat", "set_code", "regulation",
+    "date", "img", "set_img", "rarity_img", "set_key", "name_key", "type_key",
+    "identity", "released",
+)
+
+# low-cardinality columns worth interning
+_INTERNED = {"set_name", "card_type", "types", "rarity", "set_code", "regulation", "date",
+             "set_img", "rarity_img", "set_key", "type_key", "retreat", "hp"}
+
+
+class Card:
+    """One printing.  Readable as ``card.name`` or ``card["name"]``, like an sqlite3.Row."""
+
+    __slots__ = ("card_id", *COLUMNS, "attack_list", "ability_list")
+
+    def __init__(self, card_id: int, values: tuple, attack_list: list[Attack], ability_list: list[Ability]):
+        self.card_id = card_id
+        for column, value in zip(COLUMNS, values):
+            setattr(self, column, value)
+        self.attack_list = attack_list
+        self.ability_list = ability_list
+
+    def __getitem__(self, key: str):
+        return getattr(self, key)
+
+    def keys(self) -> list[str]:
+        return list(self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"Card({self.name!r}, {self.set_name!r}, {self.number!r})"
+
+
+def _int_prefix(number: str) -> int:
+    """Mirror SQLite's CAST(number AS INTEGER): leading digits, else 0."""
+    digits = ""
+    for ch in number:
+        if not ch.isdigit():
+            break
+        digits += ch
+    return int(digits) if digits else 0
+
+
+class CardCatalog:
+    def __init__(self, cards: list[Card], aliases: dict[str, str] | None = None):
+        self.cards = cards
+        self.aliases = aliases or {}    # name_aliases, for names.match_name
+        self.by_set_number: dict[tuple[str, str], Card] = {}
+        self.by_name: dict[str, list[Card]] = {}
+        self.by_name_type: dict[tuple[str, str], list[Card]] = {}
+        self.by_identity: dict[str, list[Card]] = {}
+
+        # indexes hold cards oldest first, like the SQL lookups' ORDER BY released
+        for card in sorted(cards, key=lambda c: c.released):
+            self.by_name.setdefault(card.name_key, []).append(card)
+            self.by_name_type.setdefault((card.name_key, card.type_key), []).append(card)
+            self.by_identity.setdefault(card.identity, []).append(card)
+        for card in cards:
+            self.by_set_number.setdefault((card.set_key, card.number), card)
+        # identity -> printing_rules' pick, None where the rule keeps the listed printing
+        self.by_preferred: dict[str, Card | None] = {
+            identity: choose(group[0].card_type, group) for identity, group in self.by_identity.items()
+        }
+
+    @classmethod
+    def from_connection(cls, conn: sqlite3.Connection) -> "CardCatalog":
+        present = set(table_columns(conn))
+        select = ", ".join(col if col in present else "NULL" for col in COLUMNS)
+        cur = conn.cursor()
+        attacks = attacks_for(cur)
+        abilities = abilities_for(cur)
+
+        interned = [col in _INTERNED for col in COLUMNS]
+        cards = []
+        for card_id, *values in cur.execute(f"SELECT rowid, {select} FROM cards ORDER BY rowid"):
+            values = tuple(
+                sys.intern(v) if keep and isinstance(v, str) else v
+                for v, keep in zip(values, interned)
+            )
+            card = Card(card_id, values, attacks.get(card_id, []), abilities.get(card_id, []))
+            if card.released is None:
+                # not migrated to schema version 5 yet
+                card.released = release_key(card.date)
+            cards.append(card)
+
+        aliases = {}
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'name_aliases'").fetchone():
+            aliases = dict(conn.execute("SELECT alias, name_key FROM name_aliases"))
+        return cls(cards, aliases)
+
+    @classmethod
+    def load(cls, db_path: str = DB_PATH) -> "CardCatalog":
+        conn = connect_reader(db_path)
+        try:
+            return cls.from_connection(conn)
+        finally:
+            conn.close()
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    def printing(self, set_code: str, number: str) -> Card | None:
+        return self.by_set_number.get((normalize_key(set_code), normalize_number(number)))
+
+    def related(self, card: Card) -> list[Card]:
+        return self.by_identity.get(card.identity, [])
+
+    def preferred(self, card: Card) -> Card:
+        return self.by_preferred.get(card.identity) or card
+
+    def named(self, name: str, card_type: str | None = None) -> list[Card]:
+        if card_type is None:
+            return self.by_name.get(normalize_key(name), [])
+        return self.by_name_type.get((normalize_key(name), normalize_key(card_type)), [])
+
+    def select(self, regulations: set[str] | None = None) -> list[Card]:
+        """Cards in the given regulation marks, ordered like ``short.fetch_cards``."""
+        cards = [c for c in self.cards if regulations is None or c.regulation in regulations]
+        cards.sort(key=lambda c: (c.set_name, _int_prefix(c.number)))
+        return cards
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    catalog = CardCatalog.load(db_path)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    n = len(catalog)
+    print(f"Loaded {n} cards from {db_path} in {elapsed * 1000:.0f} ms")
+    print(f"Resident: {current / 1024 / 1024:.1f} MiB ({current / max(n, 1):.0f} bytes/card), "
+          f"peak during load: {peak / 1024 / 1024:.1f} MiB")
+    print(f"Indexes: {len(catalog.by_set_number)} printings, {len(catalog.by_name_type)} names, "
+          f"{len(catalog.by_identity)} functional cards")
+
+
+if __name__ == "__main__":
+    main()
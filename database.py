@@ -0,0 +1,223 @@
+"""
+Opening pokemon_cards.db, and replacing it while it is being read.
+
+- ``connect_reader``: a read-only (``mode=ro``) connection with a large
+  memory map and page cache, for the lookup scripts and the service
+- ``connect_writer``: WAL journaling, so in-place writes (migrations,
+  ``refresh_preferred``) never block readers
+- ``create_shadow``/``swap``: the ingest builds into ``pokemon_cards.db.shadow``
+  (a copy of the live database for a refresh) and renames it over the live
+  file in one step.  Connections already open keep reading the old file to
+  the end of their transaction; new ones see the new file, never a partial
+  rebuild.  The ``-wal``/``-shm`` files now belong to the new file, so reopen
+  old connections before anything writes to it.
+- ``ConnectionPool``: read-only connections for the service, reopened once
+  ``FileWatch`` notices the file was swapped
+
+With WAL, committed writes can sit in the ``-wal`` file for a while without
+touching the database file, so anything validated against the database file
+(the snapshot, the stats cache) also compares ``wal_state``.
+
+Run nothing that writes the live file in place while an ingest swaps it.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+from urllib.parse import quote
+
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_KIB = 64 * 1024
+BUSY_TIMEOUT_MS = 5000
+CHECKPOINT_ATTEMPTS = 5
+
+SIDE_FILES = ("-wal", "-shm")
+
+
+def reader_uri(db_path: str) -> str:
+    return f"file:{quote(os.path.abspath(db_path))}?mode=ro"
+
+
+def connect_reader(db_path: str, **kwargs) -> sqlite3.Connection:
+    """A read-only connection; ``kwargs`` go to ``sqlite3.connect``."""
+    conn = sqlite3.connect(reader_uri(db_path), uri=True, **kwargs)
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_KIB}")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def connect_writer(db_path: str, **kwargs) -> sqlite3.Connection:
+    """A read-write connection in WAL mode."""
+    conn = sqlite3.connect(db_path, **kwargs)
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_KIB}")
+    return conn
+
+
+def wal_state(db_path: str) -> tuple[int, int] | None:
+    """Size and mtime of ``db_path``'s write-ahead log, or None if it holds nothing."""
+    try:
+        st = os.stat(db_path + "-wal")
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns) if st.st_size else None
+
+
+def signature(db_path: str) -> tuple:
+    """Size and mtime of ``db_path`` and of its write-ahead log: changes with every commit."""
+    stats = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            st = os.stat(path)
+        except OSError:
+            stats.append(None)
+        else:
+            stats.append((st.st_size, st.st_mtime_ns))
+    return tuple(stats)
+
+
+def file_identity(db_path: str) -> tuple[int, int] | None:
+    """The file behind ``db_path`` (device and inode): changes when it is swapped."""
+    try:
+        st = os.stat(db_path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+def shadow_path(db_path: str) -> str:
+    return db_path + ".shadow"
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def discard_shadow(db_path: str) -> None:
+    shadow = shadow_path(db_path)
+    for suffix in ("", *SIDE_FILES):
+        _remove(shadow + suffix)
+
+
+def create_shadow(db_path: str, copy: bool = True) -> str:
+    """
+    A fresh shadow database for ``db_path``: a consistent copy of it (taken
+    with the backup API, so readers carry on) or, without ``copy`` or a live
+    database, an empty file.  Returns its path.
+    """
+    discard_shadow(db_path)
+    shadow = shadow_path(db_path)
+    if copy and os.path.exists(db_path):
+        source = connect_reader(db_path)
+        target = sqlite3.connect(shadow)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+    return shadow
+
+
+def _checkpoint(db_path: str) -> None:
+    """Copy ``db_path``'s write-ahead log into it and empty the log; raises if readers keep it busy."""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        for attempt in range(CHECKPOINT_ATTEMPTS):
+            # a busy checkpoint is reported as (1, ...), not raised
+            busy, _, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            if not busy:
+                return
+            time.sleep(0.1 * (attempt + 1))
+    finally:
+        conn.close()
+    raise RuntimeError(f"could not checkpoint {db_path}: its write-ahead log stayed busy")
+
+
+def swap(shadow: str, db_path: str) -> None:
+    """
+    Rename the finished ``shadow`` (all its connections closed) over
+    ``db_path``.  The live log is checkpointed and truncated first, so the new
+    file never picks up the old one's frames; the ``-wal``/``-shm`` files stay
+    in place for SQLite and the connections still open on the old file.
+    Those must be reopened (``ConnectionPool`` does) before the new file is
+    written in place.
+    """
+    for suffix in SIDE_FILES:
+        if os.path.exists(shadow + suffix):
+            raise RuntimeError(f"{shadow} is still open (found its {suffix} file)")
+    if os.path.exists(db_path):
+        _checkpoint(db_path)
+    os.replace(shadow, db_path)
+
+
+class FileWatch:
+    """Notices ``swap`` replacing ``db_path``; checks the file at most every ``interval`` seconds."""
+
+    def __init__(self, db_path: str, interval: float = 1.0):
+        self.db_path = db_path
+        self.interval = interval
+        self.identity = file_identity(db_path)
+        self._checked = time.monotonic()
+
+    def changed(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked < self.interval:
+            return False
+        self._checked = now
+        identity = file_identity(self.db_path)
+        if identity == self.identity or identity is None:
+            return False
+        self.identity = identity
+        return True
+
+
+class ConnectionPool:
+    """
+    A fixed set of read-only connections, handed out one request at a time.
+    After a swap each one is reopened on its next checkout, so requests
+    already running finish on the old file.
+    """
+
+    def __init__(self, db_path: str, size: int, connect: Callable[..., sqlite3.Connection] = connect_reader):
+        self.db_path = db_path
+        self.size = size
+        self._connect = connect
+        self._watch = FileWatch(db_path)
+        self._lock = threading.Lock()
+        self.generation = 0
+        self._idle: queue.Queue[tuple[int, sqlite3.Connection]] = queue.Queue()
+        for _ in range(size):
+            self._idle.put((self.generation, self._open()))
+
+    def _open(self) -> sqlite3.Connection:
+        conn = self._connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def cursor(self) -> Iterator[sqlite3.Cursor]:
+        with self._lock:
+            if self._watch.changed():
+                self.generation += 1
+        generation, conn = self._idle.get()
+        try:
+            if generation != self.generation:
+                conn.close()
+                generation, conn = self.generation, self._open()
+            yield conn.cursor()
+        finally:
+            self._idle.put((generation, conn))
+
+    def close(self) -> None:
+        for _ in range(self.size):
+            self._idle.get()[1].close()
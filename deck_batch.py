@@ -0,0 +1,225 @@
+"""
+Resolve many decklists concurrently.
+
+``resolve_decks`` is the async entry point for bulk jobs such as tournament
+imports: it rewrites each decklist like ``search_special`` and yields the
+results as they complete.
+
+- Lookups run on a bounded thread pool, against the shared in-memory catalog
+  (``snapshot.CatalogSource``) or a pool of read-only SQLite connections
+  (``database.ConnectionPool``).
+- Decks in flight share their card lookups: a printing already being
+  resolved for one deck is awaited by the others rather than queried again.
+- At most ``max_in_flight`` decks are parsed or pending at a time, and the
+  input is only read as results are consumed, so memory stays flat however
+  long the input is.
+
+    async for result in resolve_decks(texts):
+        ...
+
+    python deck_batch.py decks.jsonl [--workers 4] [--max-in-flight 64] [--sqlite] > out.jsonl
+
+The command-line input is JSON lines, each a decklist string or an object with
+a ``"decklist"`` key; output is one JSON object per deck, in completion order.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterable, AsyncIterator, Iterable, NamedTuple
+
+from database import ConnectionPool
+from decklist import DeckEntry, parse_decklist
+from lookup import resolve_entries
+from schema import normalize_key, normalize_number
+from search_special import format_rewrite
+from snapshot import CatalogSource
+
+DB_PATH = "pokemon_cards.db"
+
+
+class DeckResult(NamedTuple):
+    index: int              # position of the deck in the input
+    decklist: str           # rewritten to preferred printings
+    unresolved: list[str]   # input lines whose printing is not in the database
+
+
+class _Key(NamedTuple):
+    # a normalized printing; quacks like a DeckEntry for resolve_entries
+    set_code: str
+    number: str
+
+
+class SharedLookups:
+    """Printing lookups for the decks in flight, each key resolved at most once while in use."""
+
+    def __init__(self, source, executor: ThreadPoolExecutor):
+        self._source = source
+        self._executor = executor
+        self._pending: dict[_Key, list] = {}    # key -> [future, decks using it]
+        self.requested = 0      # keys asked for, summed over decks
+        self.looked_up = 0      # keys actually sent to the database
+        self.batches = 0
+
+    def _lookup(self, keys: list[_Key]) -> dict:
+        with self._source.cursor() as cur:
+            return resolve_entries(cur, keys, with_related=False)
+
+    def _settle(self, keys: list[_Key], job: asyncio.Future) -> None:
+        error = None if job.cancelled() else job.exception()
+        for key in keys:
+            future = self._pending[key][0] if key in self._pending else None
+            if future is None or future.done():
+                continue
+            if job.cancelled():
+                future.cancel()
+            elif error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(job.result()[key])
+
+    async def resolve(self, entries: list[DeckEntry]) -> dict:
+        """``resolve_entries(cur, entries, with_related=False)``, shared with the other decks."""
+        loop = asyncio.get_running_loop()
+        keys = {e: _Key(normalize_key(e.set_code), normalize_number(e.number)) for e in entries}
+        wanted = set(keys.values())
+
+        new = []
+        for key in wanted:
+            slot = self._pending.get(key)
+            if slot is None:
+                slot = self._pending[key] = [loop.create_future(), 0]
+                new.append(key)
+            slot[1] += 1
+        self.requested += len(wanted)
+        if new:
+            self.looked_up += len(new)
+            self.batches += 1
+            job = loop.run_in_executor(self._executor, self._lookup, new)
+            job.add_done_callback(lambda job, new=new: self._settle(new, job))
+
+        try:
+            results = {key: await self._pending[key][0] for key in wanted}
+        finally:
+            for key in wanted:
+                slot = self._pending[key]
+                slot[1] -= 1
+                if slot[1] == 0:
+                    del self._pending[key]
+        return {entry: results[key] for entry, key in keys.items()}
+
+
+async def _rewrite(lookups: SharedLookups, index: int, text: str) -> DeckResult:
+    entries, basic_energy_lines = parse_decklist(text.strip().splitlines())
+    resolved = await lookups.resolve(entries)
+    decklist, unresolved = format_rewrite(entries, basic_energy_lines, resolved)
+    return DeckResult(index, decklist, [e.raw_line.strip() for e in unresolved])
+
+
+async def _aiter(texts: Iterable[str] | AsyncIterable[str]) -> AsyncIterator[str]:
+    if hasattr(texts, "__aiter__"):
+        async for text in texts:
+            yield text
+    else:
+        for text in texts:
+            yield text
+
+
+async def resolve_decks(
+    texts: Iterable[str] | AsyncIterable[str],
+    db_path: str = DB_PATH,
+    workers: int = 4,
+    max_in_flight: int = 64,
+    use_catalog: bool = True,
+    stats: dict | None = None,
+) -> AsyncIterator[DeckResult]:
+    """
+    Rewrite every decklist in ``texts`` to its preferred printings, yielding a
+    ``DeckResult`` per deck as soon as it is done (not in input order).
+
+    ``use_catalog=False`` queries ``workers`` read-only SQLite connections
+    instead of loading the in-memory catalog.  If given, ``stats`` is filled
+    with the lookup counters when the generator finishes.
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="deck-lookup")
+    if use_catalog:
+        source = await loop.run_in_executor(executor, CatalogSource, db_path)
+    else:
+        source = ConnectionPool(db_path, workers)
+    lookups = SharedLookups(source, executor)
+
+    source_iter = _aiter(texts).__aiter__()
+    in_flight: set[asyncio.Task] = set()
+    exhausted, index = False, 0
+    try:
+        while True:
+            while not exhausted and len(in_flight) < max_in_flight:
+                try:
+                    text = await source_iter.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                in_flight.add(asyncio.ensure_future(_rewrite(lookups, index, text)))
+                index += 1
+            if not in_flight:
+                break
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True)
+        # wait for lookups already running without blocking the loop, then close what they use
+        await loop.run_in_executor(None, functools.partial(executor.shutdown, wait=True, cancel_futures=True))
+        source.close()
+        if stats is not None:
+            stats.update(decks=index, requested=lookups.requested,
+                         looked_up=lookups.looked_up, batches=lookups.batches)
+
+
+def _read_jsonl(f) -> Iterable[str]:
+    for line in f:
+        if line.strip():
+            item = json.loads(line)
+            yield item["decklist"] if isinstance(item, dict) else item
+
+
+async def _main(args) -> dict:
+    stats: dict = {}
+    f = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    try:
+        async for result in resolve_decks(_read_jsonl(f), args.db, args.workers, args.max_in_flight,
+                                          use_catalog=not args.sqlite, stats=stats):
+            sys.stdout.write(json.dumps(result._asdict(), ensure_ascii=False) + "\n")
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rewrite many decklists to their preferred printings")
+    parser.add_argument("input", nargs="?", default="-", help="JSON lines of decklists (default: stdin)")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-in-flight", type=int, default=64)
+    parser.add_argument("--sqlite", action="store_true", help="query SQLite instead of the in-memory catalog")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = asyncio.run(_main(args))
+    elapsed = time.perf_counter() - start
+    sys.stderr.write(
+        f"Resolved {stats['decks']} decks in {elapsed:.2f}s ({stats['decks'] / max(elapsed, 1e-9):.0f} decks/s); "
+        f"{stats['looked_up']} of {stats['requested']} printing lookups hit the database "
+        f"in {stats['batches']} batches\n"
+    )
+
+
+if __name__ == "__main__":
+    main()
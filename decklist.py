@@ -0,0 +1,239 @@
+"""
+Decklist parsing for every script that reads decks.
+
+One pass over the lines, each dispatched on its first character, turns any
+of the formats players and the deck-building prompt produce into
+``DeckEntry`` records:
+
+- PTCG Live exports: ``Pokémon: 15`` / ``Trainer - 34`` section headers and
+  ``2 Iono's Bellibolt ex JTG 53`` lines; basic energy lines such as
+  ``8 Basic Lightning Energy Energy 4`` are kept verbatim (``kind='energy'``)
+- plain lists: ``3 Nest Ball``, with no set code or number
+- the prompt's answer dict: ``{"Arcanine SP": [3, "Pokemon"], ...}``, one
+  item per line or all on one, ``#`` comments allowed
+
+``iter_decks`` streams a multi-deck dump (a file or stdin) deck by deck: a
+deck ends at the ``}`` closing a dict, at a ``---``/``===`` line, or where a
+Pokémon section header or an opening ``{`` follows cards.
+
+    python decklist.py [decks.txt|-]        # one JSON object per deck
+    python decklist.py --bench 20000        # parse a synthetic dump, report lines/s
+"""
+import argparse
+import ast
+import json
+import re
+import sys
+import time
+from typing import Iterable, Iterator, NamedTuple
+
+
+class DeckEntry(NamedTuple):
+    quantity: int
+    name: str
+    set_code: str | None    # as written, e.g. 'JTG'; None for plain and dict entries
+    number: str | None
+    raw_line: str
+    section: str | None     # 'Pokemon', 'Trainer' or 'Energy', from the header or dict; None if not given
+    kind: str               # 'printing' (set and number), 'energy' (basic energy line) or 'name'
+
+
+# "2 Iono's Bellibolt ex JTG 53" or "3 Nest Ball"
+CARD_RE = re.compile(r"(\d+)\s+(.*?)(?:\s+([A-Z0-9]+)\s+(\d+))?")
+
+# "Pokémon: 15", "Trainer - 34", "Energy – 12"
+HEADER_RE = re.compile(r"(pok[eé]mon|trainers?|energy)\b\s*[-–:]?\s*\d*\s*$", re.IGNORECASE)
+
+# "Arcanine SP": [3, "Pokemon"]   (or single quotes, or a tuple)
+DICT_ITEM_RE = re.compile(r"""
+    (?P<key>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    \s*:\s*[\[(]\s*
+    (?P<qty>\d+)\s*,\s*
+    ["'](?P<section>[^"']*)["']
+    \s*[\])]
+""", re.VERBOSE)
+
+SEPARATOR_RE = re.compile(r"(-{3,}|={3,})\s*$")
+
+SECTIONS = {"pokemon": "Pokemon", "pokémon": "Pokemon", "trainer": "Trainer", "trainers": "Trainer",
+            "energy": "Energy"}
+
+
+def _section(text: str) -> str:
+    return SECTIONS.get(text.lower(), text)
+
+
+def _dict_key(quoted: str) -> str:
+    return ast.literal_eval(quoted) if "\\" in quoted else quoted[1:-1]
+
+
+def iter_entries(lines: Iterable[str]) -> Iterator[DeckEntry | None]:
+    """
+    Every entry in ``lines``, in order, with a ``None`` wherever a deck
+    boundary falls (see ``iter_decks``).  Lines that are not entries,
+    headers or boundaries are skipped.
+    """
+    section = None
+    seen_cards = False
+    for raw in lines:
+        line = raw.strip()
+        if not line:
+            continue
+        first = line[0]
+
+        if first.isdigit():
+            tokens = line.split(" ")
+            # PTCG Live's basic energy shape only, "8 Basic {L} Energy Energy 4";
+            # "3 Energy Switch" and "2 Energy Retrieval" are trainers
+            if len(tokens) > 3 and tokens[-1].isdigit() and tokens[-2].lower() == "energy":
+                yield DeckEntry(int(tokens[0]) if tokens[0].isdigit() else 0, " ".join(tokens[1:-2]),
+                                None, None, raw, "Energy", "energy")
+                seen_cards = True
+                continue
+            match = CARD_RE.fullmatch(line)
+            if match is None:
+                continue
+            qty, name, set_code, number = match.groups()
+            yield DeckEntry(int(qty), name.strip(), set_code, number, raw, section,
+                            "printing" if set_code else "name")
+            seen_cards = True
+
+        elif first in "{\"'":
+            if first == "{" and seen_cards:
+                yield None
+                section, seen_cards = None, False
+            for match in DICT_ITEM_RE.finditer(line):
+                yield DeckEntry(int(match["qty"]), _dict_key(match["key"]), None, None, raw,
+                                _section(match["section"]), "name")
+                seen_cards = True
+            if "}" in line:
+                yield None
+                section, seen_cards = None, False
+
+        elif first in "-=":
+            if SEPARATOR_RE.match(line):
+                yield None
+                section, seen_cards = None, False
+
+        elif first == "}":
+            yield None
+            section, seen_cards = None, False
+
+        else:
+            match = HEADER_RE.match(line)
+            if match is not None:
+                section = _section(match[1])
+                if section == "Pokemon" and seen_cards:
+                    yield None
+                    seen_cards = False
+
+
+def iter_decks(lines: Iterable[str]) -> Iterator[list[DeckEntry]]:
+    """
+    The decks in ``lines`` (e.g. an open file), each as its list of entries,
+    yielded as soon as each deck's last line has been read.
+    """
+    deck: list[DeckEntry] = []
+    for entry in iter_entries(lines):
+        if entry is None:
+            if deck:
+                yield deck
+            deck = []
+        else:
+            deck.append(entry)
+    if deck:
+        yield deck
+
+
+def parse_decklist(lines: Iterable[str]) -> tuple[list[DeckEntry], list[str]]:
+    """
+    The printings in a PTCG Live decklist (entries with a set code and
+    number), and its basic energy lines, stripped, to be re-added as written.
+    """
+    entries: list[DeckEntry] = []
+    basic_energies: list[str] = []
+    for entry in iter_entries(lines):
+        if entry is None:
+            continue
+        if entry.kind == "printing":
+            entries.append(entry)
+        elif entry.kind == "energy":
+            basic_energies.append(entry.raw_line.strip())
+    return entries, basic_energies
+
+
+def deck_dict(entries: Iterable[DeckEntry]) -> dict[str, tuple[int, str | None]]:
+    """
+    ``{name: (quantity, section)}``, the shape ``interpret.compile_deck``
+    takes; printings are named ``name SET`` as the prompt asks.  Later lines win.
+    """
+    return {
+        f"{entry.name} {entry.set_code}" if entry.kind == "printing" else entry.name: (entry.quantity, entry.section)
+        for entry in entries
+    }
+
+
+SAMPLE_DECKS = [
+    """Pokémon: 4
+2 Iono's Bellibolt ex JTG 53
+2 Raging Bolt ex TEF 123
+
+Trainer: 8
+4 Nest Ball SVI 181
+4 Professor's Research PRE 125
+
+Energy: 8
+8 Basic Lightning Energy Energy 4""",
+    """{"Raging Bolt ex TEF": [3, "Pokemon"], "Nest Ball": [4, "Trainer"],  # core
+ "Earthen Vessel": [3, "Trainer"],
+ "Lightning Energy": [8, "Energy"]}""",
+    """Pokemon - 2
+2 Iono's Tadbulb
+Trainer - 4
+4 Ultra Ball
+---""",
+]
+
+
+def bench(decks: int) -> dict:
+    """Parse a dump of ``decks`` decks cycling through ``SAMPLE_DECKS``; throughput in lines/s."""
+    lines = []
+    for i in range(decks):
+        lines.extend(SAMPLE_DECKS[i % len(SAMPLE_DECKS)].splitlines())
+    start = time.perf_counter()
+    parsed = entries = 0
+    for deck in iter_decks(lines):
+        parsed += 1
+        entries += len(deck)
+    elapsed = time.perf_counter() - start
+    return {"decks": parsed, "lines": len(lines), "entries": entries, "seconds": elapsed,
+            "lines_per_second": len(lines) / elapsed if elapsed else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse decklists into JSON, one object per deck")
+    parser.add_argument("input", nargs="?", default="-", help="decklist dump (default: stdin)")
+    parser.add_argument("--bench", type=int, metavar="DECKS", help="time parsing a synthetic dump instead")
+    args = parser.parse_args()
+
+    if args.bench:
+        result = bench(args.bench)
+        print(f"Parsed {result['decks']} decks ({result['lines']} lines, {result['entries']} entries) "
+              f"in {result['seconds']:.3f}s: {result['lines_per_second']:,.0f} lines/s")
+        return
+
+    f = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    start = time.perf_counter()
+    decks = 0
+    try:
+        for deck in iter_decks(f):
+            decks += 1
+            sys.stdout.write(json.dumps([entry._asdict() for entry in deck], ensure_ascii=False) + "\n")
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    sys.stderr.write(f"Parsed {decks} decks in {time.perf_counter() - start:.3f}s\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Local image cache for rendering decks.
+
+``deck_manifest`` lists the images a resolved deck needs: each card's
+``img`` and its set and rarity icons.  The icons are shared by thousands of
+printings, so a manifest keeps every URL once.  ``ImageCache.fetch``
+downloads the URLs it does not hold yet on a bounded thread pool, through a
+pluggable fetcher: any ``url -> bytes`` callable, ``HttpFetcher`` by default
+(``base_url`` points it at a local mirror or a stand-in ``http.server``).
+
+Files are stored content-addressed, named by the BLAKE2 hash of their bytes,
+so identical images behind different URLs are kept once.  ``index.db`` maps
+each URL to its file and records every file's size and last use; when the
+cache grows past ``max_bytes`` the least recently used files are evicted,
+never one the current request needs.
+
+    python images.py [decklist.txt | -] [--all] [--db pokemon_cards.db] [--cache-dir image_cache]
+                     [--max-mb 512] [--workers 8] [--base-url http://127.0.0.1:8000] [--manifest]
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain
+from typing import Callable, Hashable, Iterable, Mapping, NamedTuple
+from urllib.parse import urlsplit
+
+from database import connect_reader
+from decklist import parse_decklist
+from lookup import resolve_entries
+
+DB_PATH = "pokemon_cards.db"
+CACHE_DIR = "image_cache"
+MAX_BYTES = 512 * 1024 * 1024
+WORKERS = 8
+
+IMAGE_COLUMNS = ("img", "set_img", "rarity_img")
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, size INTEGER NOT NULL, used REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, digest TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS urls_digest ON urls (digest);
+CREATE INDEX IF NOT EXISTS blobs_used ON blobs (used);
+"""
+
+Fetcher = Callable[[str], bytes]
+
+
+class CardImages(NamedTuple):
+    img: str | None
+    set_img: str | None
+    rarity_img: str | None
+
+
+class Manifest(NamedTuple):
+    cards: dict[Hashable, CardImages]   # the caller's key (e.g. a DeckEntry) -> its card's images
+    urls: list[str]                     # every distinct URL, in first-use order
+
+
+class FetchReport(NamedTuple):
+    paths: dict[str, str]       # url -> cached file, for every URL that is available
+    fetched: int                # URLs downloaded by this call
+    failed: dict[str, str]      # url -> error, for the ones that could not be
+
+
+def _url(value) -> str | None:
+    # nulls are stored as the string 'none'
+    return value if value and value != "none" else None
+
+
+def card_images(card) -> CardImages:
+    """The image URLs of a cards row or ``Card``."""
+    return CardImages(*(_url(card[column]) for column in IMAGE_COLUMNS))
+
+
+def build_manifest(cards: Mapping[Hashable, object]) -> Manifest:
+    images = {key: card_images(card) for key, card in cards.items()}
+    urls = dict.fromkeys(chain.from_iterable(images.values()))
+    urls.pop(None, None)
+    return Manifest(images, list(urls))
+
+
+def deck_manifest(resolved: Mapping) -> Manifest:
+    """The images for ``lookup.resolve_entries``' result: each entry's preferred printing; unresolved ones left out."""
+    return build_manifest({entry: r.preferred for entry, r in resolved.items() if r is not None})
+
+
+class HttpFetcher:
+    """GETs each URL; with ``base_url``, from that server (same path and query) instead of the URL's own host."""
+
+    def __init__(self, timeout: float = 30.0, base_url: str | None = None):
+        self.timeout = timeout
+        self.base_url = base_url.rstrip("/") if base_url else None
+
+    def __call__(self, url: str) -> bytes:
+        if self.base_url:
+            parts = urlsplit(url)
+            url = self.base_url + parts.path + (f"?{parts.query}" if parts.query else "")
+        request = urllib.request.Request(url, headers={"User-Agent": "pokemon-cards-image-cache"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.read()
+
+
+class ImageCache:
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = MAX_BYTES, fetcher: Fetcher | None = None,
+                 workers: int = WORKERS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.fetcher = fetcher or HttpFetcher()
+        self.workers = workers
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(root, "index.db"), check_same_thread=False)
+        self._conn.executescript(INDEX_SCHEMA)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def _cached(self, urls: list[str]) -> dict[str, str]:
+        """url -> digest for the URLs whose file is still on disk."""
+        rows = self._conn.execute(
+            "SELECT url, digest FROM urls WHERE url IN (SELECT value FROM json_each(?))", (json.dumps(urls),)
+        )
+        return {url: digest for url, digest in rows if os.path.exists(self.path(digest))}
+
+    def _download(self, url: str) -> tuple[str, int]:
+        """Fetch ``url`` and store it under its content hash; runs on the worker threads."""
+        data = self.fetcher(url)
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except BaseException:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(tmp)
+                raise
+        return digest, len(data)
+
+    def fetch(self, urls: Iterable[str]) -> FetchReport:
+        """Make ``urls`` available locally, downloading the missing ones concurrently."""
+        urls = list(dict.fromkeys(urls))
+        with self._lock:
+            digests = self._cached(urls)
+        missing = [url for url in urls if url not in digests]
+
+        sizes, failed = {}, {}
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image-fetch") as executor:
+                futures = {executor.submit(self._download, url): url for url in missing}
+                for future in as_completed(futures):
+                    url = futures[future]
+                    try:
+                        digest, size = future.result()
+                    except Exception as e:
+                        failed[url] = f"{type(e).__name__}: {e}"
+                        continue
+                    digests[url] = digest
+                    sizes[digest] = size
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO blobs VALUES (?, ?, ?)",
+                                   ((digest, size, now) for digest, size in sizes.items()))
+            self._conn.executemany("INSERT OR REPLACE INTO urls VALUES (?, ?)",
+                                   ((url, digests[url]) for url in missing if url in digests))
+            self._conn.execute("UPDATE blobs SET used = ? WHERE digest IN (SELECT value FROM json_each(?))",
+                               (now, json.dumps(list(set(digests.values())))))
+            self._evict(set(digests.values()))
+        return FetchReport({url: self.path(digest) for url, digest in digests.items()}, len(missing) - len(failed),
+                           failed)
+
+    def _evict(self, keep: set[str]) -> None:
+        """Drop least recently used files, other than ``keep``, until the cache fits ``max_bytes``."""
+        total = self._conn.execute("SELECT coalesce(sum(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for digest, size in self._conn.execute("SELECT digest, size FROM blobs ORDER BY used").fetchall():
+            if total <= self.max_bytes:
+                break
+            if digest in keep:
+                continue
+            try:
+                os.remove(self.path(digest))
+            except FileNotFoundError:
+                pass
+            evicted.append((digest,))
+            total -= size
+        self._conn.executemany("DELETE FROM urls WHERE digest = ?", evicted)
+        self._conn.executemany("DELETE FROM blobs WHERE digest = ?", evicted)
+        self.evictions += len(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            files, size = self._conn.execute("SELECT count(*), coalesce(sum(size), 0) FROM blobs").fetchone()
+            urls = self._conn.execute("SELECT count(*) FROM urls").fetchone()[0]
+        return {"files": files, "bytes": size, "urls": urls, "max_bytes": self.max_bytes,
+                "evictions": self.evictions}
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the images a decklist needs into a local cache")
+    parser.add_argument("deck", nargs="?", help="decklist file, or - for stdin (default: the sample deck)")
+    parser.add_argument("--all", action="store_true", help="every card in the database instead of a deck")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--max-mb", type=float, default=MAX_BYTES / 1024 / 1024)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--base-url", help="fetch every URL's path from this server instead")
+    parser.add_argument("--manifest", action="store_true", help="print the manifest as JSON and fetch nothing")
+    args = parser.parse_args()
+
+    conn = connect_reader(args.db)
+    conn.row_factory = sqlite3.Row
+    try:
+        if args.all:
+            manifest = build_manifest({row["card_id"]: row for row in
+                                       conn.execute("SELECT rowid AS card_id, img, set_img, rarity_img FROM cards")})
+        else:
+            if args.deck is None:
+                from search_special import deck_text
+                text = deck_text
+            elif args.deck == "-":
+                text = sys.stdin.read()
+            else:
+                with open(args.deck, encoding="utf-8") as f:
+                    text = f.read()
+            entries, _ = parse_decklist(text.strip().splitlines())
+            manifest = deck_manifest(resolve_entries(conn.cursor(), entries, with_related=False))
+    finally:
+        conn.close()
+
+    if args.manifest:
+        # deck entries are listed by their line, whole-catalog cards by card_id
+        cards = [{"card": str(getattr(key, "raw_line", key)).strip(), **images._asdict()}
+                 for key, images in manifest.cards.items()]
+        json.dump({"cards": cards, "urls": manifest.urls}, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+        return
+
+    cache = ImageCache(args.cache_dir, int(args.max_mb * 1024 * 1024), HttpFetcher(base_url=args.base_url),
+                       args.workers)
+    start = time.perf_counter()
+    try:
+        report = cache.fetch(manifest.urls)
+        stats = cache.stats()
+    finally:
+        cache.close()
+    elapsed = time.perf_counter() - start
+    for url, error in report.failed.items():
+        sys.stderr.write(f"  failed {url}: {error}\n")
+    print(f"{len(manifest.cards)} cards need {len(manifest.urls)} distinct images: "
+          f"{report.fetched} downloaded, {len(report.paths) - report.fetched} already cached, "
+          f"{len(report.failed)} failed in {elapsed:.2f}s")
+    print(f"Cache: {stats['files']} files for {stats['urls']} URLs, "
+          f"{stats['bytes'] / 1024 / 1024:.1f} of {stats['max_bytes'] / 1024 / 1024:.0f} MiB")
+    if report.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Build or refresh pokemon_cards.db from a PTCG-database checkout.
+
+Each upstream JSON file is one card.  The content hash of every ingested file
+is recorded in ``ingest_files`` and each card row remembers its ``source``
+file, so a refresh only re-reads files that were added, modified or deleted
+and replaces just their rows, all in one transaction.  A database without
+ingest records (e.g. built by an older extract.ipynb) is rebuilt from scratch.
+
+Files are streamed in chunks through a process pool: a first pass hashes
+every file and collects the columns the changed ones use, a second pass
+parses, normalizes and derives (``schema.derive``) each changed card into
+compact row tuples.  This process is the single writer and inserts the
+chunks in order; at most two chunks per worker are in flight, so peak memory
+does not grow with the size of the upstream repo.
+
+The work happens in a shadow copy (``database.create_shadow``) that is renamed
+over the live database when it is complete, so scripts and the service keep
+reading the old cards until then and never see a half-applied refresh.
+``--in-place`` writes the live database directly instead (WAL keeps readers
+unblocked, but they see each commit as it lands).
+
+    python ingest.py [--pull] [--full] [--in-place] [--repo PTCG-database] [--db pokemon_cards.db]
+"""
+import argparse
+import glob
+import hashlib
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Iterable, Iterator
+
+import orjson
+
+import database
+import schema
+import snapshot
+from cache import LOOKUP_CACHE, database_path
+from catalog import CardCatalog
+
+DB_PATH = "pokemon_cards.db"
+REPO_PATH = "PTCG-database"
+REPO_URL = "https://github.com/type-null/PTCG-database"
+BATCH_SIZE = 500
+
+DESIRED_ORDER = [
+    "set_name",
+    "number",
+
+    "name",
+    "card_type",
+    "types",
+    "hp",
+    "level",
+    "stage",
+    "evolve_from",
+
+    "rarity",
+    "rarity_img",
+
+    "abilities",
+    "attacks",
+    "effect",
+    "tera_effect",
+    "vstar_power",
+    "ancient_trait",
+    "poke_power",
+    "poke_body",
+    "held_item",
+    "rule_box",
+
+    "weakness",
+    "resistance",
+    "retreat",
+    "tags",
+
+    "set_full_name",
+    "set_code",
+    "set_total",
+    "regulation",
+    "series",
+    "author",
+    "date",
+    "flavor_text",
+
+    "img",
+    "set_img",
+    "url"
+]
+
+INGEST_TABLES = {
+    "ingest_files": "path TEXT PRIMARY KEY, hash TEXT NOT NULL",
+    "ingest_meta": "key TEXT PRIMARY KEY, value TEXT",
+}
+
+
+def pull(repo: str) -> None:
+    if os.path.exists(repo):
+        subprocess.run(["git", "-C", repo, "pull"], check=True)
+    else:
+        subprocess.run(["git", "clone", REPO_URL, repo], check=True)
+
+
+def repo_commit(repo: str) -> str | None:
+    try:
+        out = subprocess.run(["git", "-C", repo, "rev-parse", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def normalize_value(col: str, val) -> str:
+    """Same value normalization the notebook applied: lower-cased text, plain numbers, ISO dates."""
+    if not str(val).startswith("http"):
+        val = str(val).lower().replace('pokémon', 'pokemon').replace("(item)", "item", 1).replace('’', "'")
+    if val.isnumeric():
+        val = str(int(val))
+    if col == "date" and val and val != "none":
+        val = datetime.strptime(val, "%b %d, %Y").strftime("%Y-%m-%d")
+    return str(val)
+
+
+def load_doc(data_dir: str, rel_path: str) -> dict:
+    with open(os.path.join(data_dir, rel_path), "rb") as f:
+        return orjson.loads(f.read())
+
+
+def _scan_chunk(data_dir: str, items: list[tuple[str, str | None]]) -> tuple[dict[str, str], set[str]]:
+    """
+    First pass, in a worker: hash each ``(path, known hash)`` file and, for the
+    ones that changed, collect the keys that carry a value.
+    """
+    hashes, non_null = {}, set()
+    for rel_path, known_hash in items:
+        with open(os.path.join(data_dir, rel_path), "rb") as f:
+            data = f.read()
+        hashes[rel_path] = hashlib.blake2b(data, digest_size=16).hexdigest()
+        if known_hash != hashes[rel_path]:
+            non_null.update(key for key, val in orjson.loads(data).items() if val is not None)
+    return hashes, non_null
+
+
+def _prepare_chunk(data_dir: str, columns: list[str], paths: list[str]) -> list[tuple[list[str], schema.Derived]]:
+    """
+    Second pass, in a worker: parse and normalize each file into its ``cards``
+    row (plus source path) and everything ``schema.derive`` computes from it.
+    """
+    sources = [columns.index(col) if col in columns else None for col in schema.SOURCE_COLUMNS]
+    prepared = []
+    for path in paths:
+        doc = load_doc(data_dir, path)
+        row = [normalize_value(col, doc.get(col)) for col in columns]
+        derived = schema.derive(*(None if i is None else row[i] for i in sources))
+        prepared.append((row + [path], derived))
+    return prepared
+
+
+def chunked(items: list, size: int) -> Iterator[list]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def ordered_map(executor: Executor | None, fn, arg_tuples: Iterable[tuple], window: int) -> Iterator:
+    """
+    ``fn(*args)`` for each tuple, results in order, with at most ``window``
+    calls in flight so finished chunks never pile up ahead of the writer.
+    Runs inline when there is no executor.
+    """
+    if executor is None:
+        for args in arg_tuples:
+            yield fn(*args)
+        return
+    pending: deque[Future] = deque()
+    for args in arg_tuples:
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def ordered_columns(columns) -> list[str]:
+    ordered = [col for col in DESIRED_ORDER if col in columns]
+    return ordered + sorted(set(columns) - set(ordered))
+
+
+def _has_ingest_records(conn: sqlite3.Connection) -> bool:
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ingest_files'").fetchone()
+    return bool(exists) and conn.execute("SELECT 1 FROM ingest_files LIMIT 1").fetchone() is not None
+
+
+def _copy_user_tables(conn: sqlite3.Connection) -> None:
+    """Copy ``schema.NAME_TABLES`` (edited by hand, not rebuilt from upstream) from the attached ``live`` database."""
+    live = {name for (name,) in conn.execute("SELECT name FROM live.sqlite_master WHERE type = 'table'")}
+    for table in schema.NAME_TABLES:
+        if table in live:
+            conn.execute(f"INSERT OR REPLACE INTO main.{table} SELECT * FROM live.{table}")
+
+
+def ingest(
+    db_path: str = DB_PATH,
+    repo: str = REPO_PATH,
+    full: bool = False,
+    batch_size: int = BATCH_SIZE,
+    write_snapshot: bool = True,
+    workers: int | None = None,
+    in_place: bool = False,
+) -> dict:
+    """Bring ``db_path`` in line with the checkout; returns counts of what changed."""
+    data_dir = os.path.join(repo, "data_en")
+    workers = workers or os.cpu_count() or 1
+    files = sorted(
+        os.path.relpath(path, data_dir).replace(os.sep, "/")
+        for path in glob.glob(os.path.join(data_dir, "**", "*.json"), recursive=True)
+    )
+
+    target = db_path if in_place else database.create_shadow(db_path, copy=not full)
+    conn = database.connect_writer(target)
+    # an empty shadow still takes the hand-edited tables over from the live database
+    keep_from_live = full and not in_place and os.path.exists(db_path)
+    if keep_from_live:
+        conn.execute("ATTACH DATABASE ? AS live", (db_path,))
+    full = full or not _has_ingest_records(conn)
+    known = {} if full else dict(conn.execute("SELECT path, hash FROM ingest_files"))
+
+    with ProcessPoolExecutor(workers) if workers > 1 else nullcontext() as executor:
+        current, non_null = {}, set()
+        scan_args = ((data_dir, [(p, known.get(p)) for p in chunk]) for chunk in chunked(files, batch_size))
+        for hashes, keys in ordered_map(executor, _scan_chunk, scan_args, workers * 2):
+            current.update(hashes)
+            non_null |= keys
+        added = [p for p in current if p not in known]
+        modified = [p for p in current if p in known and known[p] != current[p]]
+        deleted = [p for p in known if p not in current]
+
+        conn.execute("BEGIN")
+        try:
+            if full:
+                rebuilt = ("cards", *schema.TABLES, *schema.GROUP_TABLES, schema.SEARCH_TABLE, *INGEST_TABLES)
+                for table in rebuilt:
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+                cols_definition = ", ".join(f'"{col}" TEXT' for col in ordered_columns(non_null))
+                conn.execute(f'CREATE TABLE cards ({cols_definition}, "source" TEXT)')
+            else:
+                existing = set(schema.table_columns(conn))
+                for col in ordered_columns(non_null - existing):
+                    conn.execute(f'ALTER TABLE cards ADD COLUMN "{col}" TEXT DEFAULT \'none\'')
+            for table, definition in INGEST_TABLES.items():
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({definition})")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cards_source ON cards(source)")
+            schema.ensure_schema(conn)
+            if keep_from_live:
+                _copy_user_tables(conn)
+
+            # the delete trigger from schema.TRIGGERS takes the child rows with them
+            conn.executemany("DELETE FROM cards WHERE source = ?", ((p,) for p in modified + deleted))
+            conn.executemany("DELETE FROM ingest_files WHERE path = ?", ((p,) for p in deleted))
+
+            # every upstream column gets a value, "none" included, as the notebook wrote them
+            derived_columns = ["source", *schema.DERIVED_COLUMNS]
+            columns = [col for col in schema.table_columns(conn) if col not in derived_columns]
+            all_columns = ["rowid", *columns, *derived_columns]
+            insert_sql = f"INSERT INTO cards ({', '.join(all_columns)}) VALUES ({', '.join('?' * len(all_columns))})"
+
+            # this process is the only writer; it numbers the rows so the workers'
+            # attack/ability rows can go straight into the child tables
+            next_id = (conn.execute("SELECT max(rowid) FROM cards").fetchone()[0] or 0) + 1
+            prepare_args = ((data_dir, columns, chunk) for chunk in chunked(added + modified, batch_size))
+            for prepared in ordered_map(executor, _prepare_chunk, prepare_args, workers * 2):
+                ids = range(next_id, next_id + len(prepared))
+                next_id += len(prepared)
+                conn.executemany(insert_sql, ((i, *row, *d.columns) for i, (row, d) in zip(ids, prepared)))
+                schema.write_children(conn, [(i, d) for i, (_, d) in zip(ids, prepared)])
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO ingest_files (path, hash) VALUES (?, ?)",
+                ((p, current[p]) for p in added + modified),
+            )
+            conn.execute("INSERT OR REPLACE INTO ingest_meta VALUES ('commit', ?)", (repo_commit(repo),))
+            conn.execute("INSERT OR REPLACE INTO ingest_meta VALUES ('ingested_at', ?)", (datetime.now().isoformat(timespec="seconds"),))
+
+            schema.upgrade(conn)
+            conn.commit()
+            if keep_from_live:
+                conn.execute("DETACH DATABASE live")
+        except BaseException:
+            conn.rollback()
+            conn.close()
+            if not in_place:
+                database.discard_shadow(db_path)
+            raise
+
+    conn.execute("ANALYZE")
+    # the snapshot is the in-memory catalog, so this step is the one that scales with the card count
+    catalog = CardCatalog.from_connection(conn) if write_snapshot else None
+    conn.close()
+    if not in_place:
+        database.swap(target, db_path)
+
+    # lookups this process cached may predate the commit (the file check only runs once a second)
+    conn = database.connect_reader(db_path)
+    LOOKUP_CACHE.invalidate(database_path(conn.cursor()))
+    conn.close()
+    if catalog is not None:
+        snapshot.write_snapshot(catalog, db_path)
+    return {"full": full, "added": len(added), "modified": len(modified), "deleted": len(deleted), "workers": workers}
+
+
+def peak_rss_mib() -> tuple[float, float] | None:
+    """Peak RSS of this (writer) process and of the largest worker, in MiB."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # kilobytes on Linux, bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--repo", default=REPO_PATH)
+    parser.add_argument("--pull", action="store_true", help="git pull (or clone) the repo first")
+    parser.add_argument("--full", action="store_true", help="rebuild instead of applying changes")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="files per work unit / insert batch")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: one per core, 1 = no pool)")
+    parser.add_argument("--no-snapshot", action="store_true", help="skip writing the catalog snapshot")
+    parser.add_argument("--in-place", action="store_true", help="write the live database instead of a shadow copy")
+    args = parser.parse_args()
+
+    if args.pull:
+        pull(args.repo)
+    if not os.path.isdir(os.path.join(args.repo, "data_en")):
+        sys.exit(f"{args.repo}/data_en not found (use --pull to clone it)")
+
+    start = time.perf_counter()
+    result = ingest(args.db, args.repo, full=args.full, batch_size=args.batch_size,
+                    write_snapshot=not args.no_snapshot, workers=args.workers, in_place=args.in_place)
+    elapsed = time.perf_counter() - start
+    mode = "Rebuilt" if result["full"] else "Updated"
+    print(f"{mode} {args.db} in {elapsed:.1f}s with {result['workers']} worker(s): "
+          f"{result['added']} added, {result['modified']} modified, {result['deleted']} deleted")
+    rss = peak_rss_mib()
+    if rss is not None:
+        print(f"Peak RSS: {rss[0]:.0f} MiB writer, {rss[1]:.0f} MiB largest worker")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Opt-in instrumentation of the SQLite lookups.
+
+Connections opened with ``connect`` (or any connection whose cursors come
+from ``InstrumentedCursor``) time every statement from ``execute`` through
+its last fetch and record, per query:
+
+- a latency histogram (``BUCKETS``)
+- rows returned, and the work SQLite did for them, counted in virtual machine
+  steps by a progress handler (``STEP``) -- the nearest to "rows scanned" the
+  sqlite3 module exposes
+- slow statements (over ``slow_ms``), logged as JSON lines with their SQL,
+  bound parameters and the deck line being resolved (see ``deck_line``)
+
+Queries are labelled with their names from the modules' ``QUERIES`` tables
+(``fetch_printing``, ``lookup_card``, ...), other SQL with its first words.
+``prometheus()`` renders these and the lookup cache's hit counts in the
+Prometheus text format (``service.py --instrument`` serves it at ``GET /metrics``).
+
+Uninstrumented connections pay nothing.
+
+    conn = instrument.connect("pokemon_cards.db", slow_ms=20, slow_log="slow.jsonl")
+"""
+import bisect
+import json
+import sqlite3
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+from cache import LOOKUP_CACHE, LookupCache
+
+# upper bounds, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# the progress handler runs every STEP virtual machine instructions
+STEP = 100
+
+PREFIX = "cards"
+
+# the deck line whose lookups are running, for the slow-query log
+deck_line: ContextVar[str | None] = ContextVar("deck_line", default=None)
+
+_labels: dict[str, str] | None = None
+
+
+def _known_queries() -> dict[str, str]:
+    global _labels
+    if _labels is None:
+        # imported here: these modules import the lookups this one instruments
+        import interpret
+        import lookup
+        import names
+        import search_text
+        labels = {}
+        for module in (lookup, interpret, names, search_text):
+            labels.update({" ".join(sql.split()): label for label, sql in module.QUERIES.items()})
+        _labels = labels
+    return _labels
+
+
+def query_label(sql: str) -> str:
+    text = " ".join(sql.split())
+    return _known_queries().get(text) or " ".join(text.split(" ", 4)[:4]).lower()
+
+
+class QueryStats:
+    __slots__ = ("count", "seconds", "buckets", "rows", "steps", "slow")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.rows = 0
+        self.steps = 0
+        self.slow = 0
+
+
+class Metrics:
+    def __init__(self, slow_ms: float | None = None, slow_log=None, cache: LookupCache = LOOKUP_CACHE):
+        self.slow_ms = slow_ms
+        self.slow_log = slow_log    # a path, a writable file or None for stderr
+        self.cache = cache
+        self.queries: dict[str, QueryStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, sql: str, parameters, seconds: float, rows: int, steps: int) -> None:
+        label = query_label(sql)
+        slow = self.slow_ms is not None and seconds * 1000 >= self.slow_ms
+        with self._lock:
+            stats = self.queries.get(label)
+            if stats is None:
+                stats = self.queries[label] = QueryStats()
+            stats.count += 1
+            stats.seconds += seconds
+            stats.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+            stats.rows += rows
+            stats.steps += steps
+            stats.slow += slow
+        if slow:
+            self._log_slow(label, sql, parameters, seconds, rows, steps)
+
+    def _log_slow(self, label: str, sql: str, parameters, seconds: float, rows: int, steps: int) -> None:
+        line = json.dumps({
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "query": label,
+            "ms": round(seconds * 1000, 3),
+            "rows": rows,
+            "steps": steps * STEP,
+            "deck_line": deck_line.get(),
+            "sql": " ".join(sql.split()),
+            "parameters": parameters,
+        }, ensure_ascii=False, default=str)
+        with self._lock:
+            if self.slow_log is None:
+                sys.stderr.write(line + "\n")
+            elif isinstance(self.slow_log, str):
+                with open(self.slow_log, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            else:
+                self.slow_log.write(line + "\n")
+                self.slow_log.flush()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.queries.clear()
+
+    def snapshot(self) -> dict:
+        """Per-query totals, for JSON."""
+        with self._lock:
+            return {
+                label: {
+                    "count": s.count,
+                    "seconds": s.seconds,
+                    "mean_ms": s.seconds / s.count * 1000 if s.count else 0.0,
+                    "rows": s.rows,
+                    "steps": s.steps * STEP,
+                    "slow": s.slow,
+                }
+                for label, s in self.queries.items()
+            }
+
+    def prometheus(self) -> str:
+        """Every counter, in the Prometheus text exposition format."""
+        out = []
+
+        def family(name: str, kind: str, help_text: str) -> None:
+            out.append(f"# HELP {PREFIX}_{name} {help_text}")
+            out.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+        with self._lock:
+            queries = sorted(self.queries.items())
+            family("query_seconds", "histogram", "SQLite statement latency, execute through last fetch.")
+            for label, s in queries:
+                q = _escape(label)
+                cumulative = 0
+                for bound, n in zip(BUCKETS + (float("inf"),), s.buckets):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    out.append(f'{PREFIX}_query_seconds_bucket{{query="{q}",le="{le}"}} {cumulative}')
+                out.append(f'{PREFIX}_query_seconds_sum{{query="{q}"}} {s.seconds!r}')
+                out.append(f'{PREFIX}_query_seconds_count{{query="{q}"}} {s.count}')
+            for name, attr, scale, help_text in (
+                ("query_rows_returned_total", "rows", 1, "Rows fetched."),
+                ("query_vm_steps_total", "steps", STEP, "SQLite virtual machine steps run (rows scanned, roughly)."),
+                ("slow_queries_total", "slow", 1, "Statements over the slow-query threshold."),
+            ):
+                family(name, "counter", help_text)
+                for label, s in queries:
+                    out.append(f'{PREFIX}_{name}{{query="{_escape(label)}"}} {getattr(s, attr) * scale}')
+
+        stats = self.cache.stats()
+        for name, key, help_text in (
+            ("lookup_cache_hits_total", "hits", "Memoized lookups answered from the cache."),
+            ("lookup_cache_misses_total", "misses", "Memoized lookups that ran their query."),
+        ):
+            family(name, "counter", help_text)
+            for function, counts in sorted(stats["functions"].items()):
+                out.append(f'{PREFIX}_{name}{{function="{_escape(function)}"}} {counts[key]}')
+        family("lookup_cache_evictions_total", "counter", "Entries evicted from the lookup cache.")
+        out.append(f"{PREFIX}_lookup_cache_evictions_total {stats['evictions']}")
+        family("lookup_cache_entries", "gauge", "Entries in the lookup cache.")
+        out.append(f"{PREFIX}_lookup_cache_entries {stats['size']}")
+        return "\n".join(out) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = Metrics()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    A cursor that reports each statement to ``connection.metrics`` (or
+    ``METRICS``) once its rows are exhausted, the next statement runs or the
+    cursor is closed.
+    """
+
+    _pending = None     # [sql, parameters, seconds, rows, steps at start]
+
+    def _steps(self) -> int:
+        return getattr(self.connection, "steps", 0)
+
+    def _finish(self) -> None:
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            sql, parameters, seconds, rows, start_steps = pending
+            metrics = getattr(self.connection, "metrics", METRICS)
+            metrics.record(sql, parameters, seconds, rows, self._steps() - start_steps)
+
+    def _timed(self, fetch, *args):
+        start = time.perf_counter()
+        result = fetch(*args)
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - start
+        return result
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self._pending = [sql, parameters, 0.0, 0, self._steps()]
+        self._timed(super().execute, sql, parameters)
+        if self.description is None:
+            self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        elif self._pending is not None:
+            self._pending[3] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if self._pending is not None:
+            self._pending[3] += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        if self._pending is not None:
+            self._pending[3] += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        if self._pending is not None:
+            self._pending[3] += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """A connection whose cursors (including ``execute``'s) are ``InstrumentedCursor``s."""
+
+    metrics = METRICS
+    steps = 0
+
+    def _count_steps(self) -> int:
+        self.steps += 1
+        return 0
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+
+def connect(database: str, metrics: Metrics | None = None, slow_ms: float | None = None, slow_log=None,
+            opener=sqlite3.connect, **kwargs) -> sqlite3.Connection:
+    """
+    An instrumented connection, opened by ``opener`` (``sqlite3.connect`` or
+    e.g. ``database.connect_reader``).  Statements are recorded in ``metrics``
+    (the shared ``METRICS`` by default, whose slow-query threshold and log
+    ``slow_ms``/``slow_log`` set when given).
+    """
+    conn = opener(database, factory=InstrumentedConnection, **kwargs)
+    if metrics is not None:
+        conn.metrics = metrics
+    if slow_ms is not None:
+        conn.metrics.slow_ms = slow_ms
+    if slow_log is not None:
+        conn.metrics.slow_log = slow_log
+    conn.set_progress_handler(conn._count_steps, STEP)
+    return conn
@@ -1,52 +1,88 @@
-import sys, sqlite3, ast, re
+import sys, string
 
-def read_until_double_newline():
-    lines = []
-    for raw in sys.stdin:
-        line = re.sub(r'\s+#.*$', '', raw)
-        lines.append(line)
-        if '}' in raw:
-            break
-    return "".join(lines)
-
-def load_deck(input_text):
-    try:
-        deck = ast.literal_eval(input_text)
-        if not isinstance(deck, dict):
-            raise ValueError("Expected a dict of cards")
-        return deck
-    except Exception as e:
-        sys.exit(f"Failed to parse deck list: {e}")
+from cache import memoized
+from catalog import CardCatalog
+from database import connect_reader
+from decklist import deck_dict, iter_decks
+from instrument import deck_line
+from names import match_name
+from schema import normalize_key
+from snapshot import load_catalog
+
+def load_deck(lines):
+    """The first deck in ``lines`` (stdin stops being read at its closing brace), as ``{name: (count, category)}``."""
+    deck = next(iter_decks(lines), None)
+    if not deck:
+        sys.exit("Failed to parse deck list: expected a dict of cards")
+    return deck_dict(deck)
+
+LOOKUP_IN_SET_SQL = """
+    SELECT set_name, number
+      FROM cards
+    WHERE name_key = ? AND set_key = ?
+"""
+
+# the newest qualifying printing
+LOOKUP_SQL = """
+    SELECT set_name, number
+      FROM cards
+    WHERE name_key = ? AND (rarity IS NULL OR rarity IN ('common', 'uncommon', 'ace spec rare', 'rare', 'rare holo'))
+  ORDER BY released DESC, rowid DESC
+  LIMIT 1
+"""
+
+QUERIES = {
+    "lookup_card (set)": LOOKUP_IN_SET_SQL,
+    "lookup_card": LOOKUP_SQL,
+}
+
+LOOKUP_RARITIES = {'common', 'uncommon', 'ace spec rare', 'rare', 'rare holo'}
+
+def lookup_card_in_catalog(name, catalog, set_name=None):
+    cards = catalog.named(name)
+    if set_name is not None:
+        in_set = [c for c in cards if c.set_key == normalize_key(set_name)]
+        if in_set:
+            return in_set[0].set_name, in_set[0].number
+
+    cards = [c for c in cards if c.rarity is None or c.rarity in LOOKUP_RARITIES]
+    if not cards:
+        return None, None
+    return cards[-1].set_name, cards[-1].number
 
 def lookup_card(name, cursor, set_name=None):
+    if isinstance(cursor, CardCatalog):
+        return lookup_card_in_catalog(name, cursor, set_name)
+    return lookup_card_in_db(cursor, name, set_name)
+
+@memoized(key=lambda name, set_name: (normalize_key(name), normalize_key(set_name)))
+def lookup_card_in_db(cursor, name, set_name=None):
     if set_name is not None:
-        cursor.execute("""
-            SELECT set_name, number
-              FROM cards
-            WHERE name = ? AND set_name = ?
-        """, (name.lower(), set_name.lower()))
+        cursor.execute(LOOKUP_IN_SET_SQL, (normalize_key(name), normalize_key(set_name)))
         rows = cursor.fetchall()
         if rows:
             return rows[0][0], rows[0][1]
     
-    cursor.execute("""
-        SELECT set_name, number, date, card_type
-          FROM cards
-        WHERE name = ? AND (rarity IS NULL OR rarity IN ('common', 'uncommon', 'ace spec rare', 'rare', 'rare holo'))
-      ORDER BY date ASC
-    """, (name.lower(),))
-    rows = cursor.fetchall()
-    if not rows:
+    cursor.execute(LOOKUP_SQL, (normalize_key(name),))
+    row = cursor.fetchone()
+    if row is None:
         return None, None
-    return rows[-1][0], rows[-1][1]
+    return row[0], row[1]
 
-def compile_deck(deck_dict, db_path="pokemon_cards.db"):
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
+def compile_deck(deck_dict, db_path="pokemon_cards.db", catalog=None, cursor=None):
+    if catalog is not None:
+        conn, cur = None, catalog
+    elif cursor is not None:
+        conn, cur = None, cursor
+    else:
+        conn = connect_reader(db_path)
+        cur = conn.cursor()
 
     groups = {"Pokemon": [], "Trainer": [], "Energy": []}
+    outer_line = deck_line.get()
 
     for full_key, (count, category) in deck_dict.items():
+        deck_line.set(full_key)
         if category == "Pokemon":
             parts = full_key.split(" ")
             name = ' '.join(parts[:-1])
@@ -54,27 +90,37 @@ def compile_deck(deck_dict, db_path="pokemon_cards.db"):
             if set_name.isdigit():
                 groups[category].append((count, full_key, '', ''))
                 continue
-            set_name, number = lookup_card(name, cur, set_name=set_name)
+            in_set = set_name
+            set_name, number = lookup_card(name, cur, set_name=in_set)
+            if set_name is None:
+                match = match_name(cur, name)
+                if match is not None:
+                    set_name, number = lookup_card(match.name_key, cur, set_name=in_set)
+            if set_name is None:
+                sys.stderr.write(f"Warning: no entry found in DB for {full_key!r}\n")
+                continue
 
         elif category in ("Trainer", "Energy"):
-            for i in range(0, 3):
-                full_key = full_key.replace('Dark Energy', 'Darkness Energy')
-                parts = full_key.split(" ")
-                if i == 0:
-                    set_name, number = lookup_card(full_key, cur)
-                else:
-                    set_name, number = lookup_card(' '.join(parts[:-i]), cur)
-                if set_name:
-                    break
+            # one probe covers typos, aliases and trailing set codes/numbers
+            match = match_name(cur, full_key)
+            set_name, number = lookup_card(match.name_key, cur) if match else (None, None)
+            if match is not None and match.how == "alias":
+                full_key = string.capwords(match.name_key)
             if set_name is None:
                 sys.stderr.write(f"Warning: no entry found in DB for {full_key!r}\n")
                 continue
+        else:
+            sys.stderr.write(f"Warning: {full_key!r} is not listed as Pokemon, Trainer or Energy\n")
+            continue
         groups[category].append((count, full_key, set_name, number))
 
-    conn.close()
+    deck_line.set(outer_line)
+    if conn is not None:
+        conn.close()
     return groups
 
-def print_deck(groups):
+def format_deck(groups):
+    lines = []
     ttotal = 0
     for cat in ("Pokemon", "Trainer", "Energy"):
         entries = groups.get(cat, [])
@@ -82,17 +128,20 @@ def print_deck(groups):
             continue
         total = sum(e[0] for e in entries)
         ttotal += total
-        print(f"{cat} – {total}")
+        lines.append(f"{cat} – {total}")
         for e in entries:
             count, name, set_name, number = e
-            print(f"{count} {name.replace(set_name.upper(), '')} {set_name.upper()} {number}".replace('  ', ' '))
-        print()
-    print(f"Total – {ttotal}")
+            lines.append(f"{count} {name.replace(set_name.upper(), '')} {set_name.upper()} {number}".replace('  ', ' '))
+        lines.append("")
+    lines.append(f"Total – {ttotal}")
+    return "\n".join(lines)
+
+def print_deck(groups):
+    print(format_deck(groups))
 
 def main():
-    raw = read_until_double_newline()
-    deck = load_deck(raw)
-    groups = compile_deck(deck)
+    deck = load_deck(sys.stdin)
+    groups = compile_deck(deck, catalog=load_catalog())
     print_deck(groups)
 
 if __name__ == "__main__":
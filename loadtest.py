@@ -0,0 +1,121 @@
+"""
+Load test for service.py.
+
+Sends the same request from ``--concurrency`` keep-alive clients until
+``--requests`` have completed, then reports throughput and latency
+percentiles.  Start the service first (``python service.py --quiet``).
+
+    python loadtest.py [--url http://127.0.0.1:8080] [--endpoint rewrite|compile]
+                       [--deck decklist.txt] [--requests 2000] [--concurrency 8]
+"""
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+from search_special import deck_text
+
+SAMPLE_COMPILE = {
+    "Iono's Bellibolt ex JTG": [2, "Pokemon"],
+    "Raging Bolt ex TEF": [3, "Pokemon"],
+    "Earthen Vessel": [3, "Trainer"],
+    "Nest Ball": [3, "Trainer"],
+    "Professor's Research": [3, "Trainer"],
+    "Lightning Energy": [8, "Energy"],
+}
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def run(url: str, path: str, body: bytes, content_type: str, total: int, concurrency: int) -> dict:
+    parts = urlsplit(url)
+    remaining = [total]
+    lock = threading.Lock()
+    latencies: list[float] = []
+    errors: list[str] = []
+
+    def client():
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        local = []
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    break
+                remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                conn.request("POST", path, body, {"Content-Type": content_type})
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors.append(f"HTTP {response.status}")
+            except (OSError, http.client.HTTPException) as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "seconds": elapsed,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for service.py")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--endpoint", choices=("rewrite", "compile"), default="rewrite")
+    parser.add_argument("--deck", help="decklist text file (rewrite) or JSON dict (compile) to send")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if args.endpoint == "rewrite":
+        text = open(args.deck, encoding="utf-8").read() if args.deck else deck_text
+        body, content_type = text.encode(), "text/plain; charset=utf-8"
+    else:
+        deck = json.load(open(args.deck, encoding="utf-8")) if args.deck else SAMPLE_COMPILE
+        body, content_type = json.dumps(deck).encode(), "application/json"
+
+    report = run(args.url, f"/{args.endpoint}", body, content_type, args.requests, args.concurrency)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print(f"{report['requests']} requests to /{args.endpoint} from {args.concurrency} clients "
+              f"in {report['seconds']:.2f}s: {report['rps']:.0f} req/s")
+        print(f"latency p50 {report['p50_ms']:.2f} ms, p99 {report['p99_ms']:.2f} ms, max {report['max_ms']:.2f} ms")
+        if report["errors"]:
+            print(f"{report['errors']} errors, first: {report['first_error']}")
+    if report["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
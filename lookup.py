@@ -0,0 +1,149 @@
+"""
+Card lookups shared by the search scripts.
+
+All queries filter on the pre-normalized key columns and child tables added by
+``schema.migrate`` so SQLite can answer them from an index instead of scanning
+``cards``.  Rows carry the card's rowid as ``card_id``.
+
+Each function also accepts a ``catalog.CardCatalog`` in place of the cursor and
+then answers from its in-memory indexes.  The single-card lookups are memoized
+per database file (see ``cache``).
+"""
+import json
+import sqlite3
+from typing import Hashable, Iterable, NamedTuple
+
+from cache import memoized
+from catalog import CardCatalog
+from schema import normalize_key, normalize_number
+
+PRINTING_SQL = "SELECT rowid AS card_id, * FROM cards WHERE set_key = ? AND number = ? LIMIT 1"
+
+RELATED_SQL = """
+    SELECT rowid AS card_id, *
+    FROM cards
+    WHERE identity = ?
+    ORDER BY released, rowid
+"""
+
+# the batch queries take their keys as a single JSON array parameter
+BATCH_PRINTING_SQL = """
+    SELECT c.rowid AS card_id, c.*
+    FROM json_each(?) w
+    JOIN cards c ON c.set_key = json_extract(w.value, '$[0]')
+                AND c.number  = json_extract(w.value, '$[1]')
+    ORDER BY c.rowid
+"""
+
+BATCH_RELATED_SQL = """
+    SELECT rowid AS card_id, *
+    FROM cards
+    WHERE identity IN (SELECT value FROM json_each(?))
+    ORDER BY identity, released, rowid
+"""
+
+PREFERRED_SQL = """
+    SELECT c.rowid AS card_id, c.*
+    FROM preferred_printings p
+    JOIN cards c ON c.rowid = p.card_id
+    WHERE p.identity = ?
+"""
+
+BATCH_PREFERRED_SQL = """
+    SELECT c.rowid AS card_id, c.*
+    FROM preferred_printings p
+    JOIN cards c ON c.rowid = p.card_id
+    WHERE p.identity IN (SELECT value FROM json_each(?))
+"""
+
+QUERIES = {
+    "fetch_printing": PRINTING_SQL,
+    "fetch_related": RELATED_SQL,
+    "fetch_preferred": PREFERRED_SQL,
+    "resolve_entries (printings)": BATCH_PRINTING_SQL,
+    "resolve_entries (related)": BATCH_RELATED_SQL,
+    "resolve_entries (preferred)": BATCH_PREFERRED_SQL,
+}
+
+
+class Resolution(NamedTuple):
+    printing: sqlite3.Row
+    related: list[sqlite3.Row]
+    preferred: sqlite3.Row      # printing_rules' pick for the deck; ``printing`` itself when the rule keeps it
+
+
+@memoized(key=lambda set_code, card_no: (normalize_key(set_code), normalize_number(card_no)))
+def fetch_printing(cur: sqlite3.Cursor | CardCatalog, set_code: str, card_no: str) -> sqlite3.Row | None:
+    if isinstance(cur, CardCatalog):
+        return cur.printing(set_code, card_no)
+    cur.execute(PRINTING_SQL, (normalize_key(set_code), normalize_number(card_no)))
+    return cur.fetchone()
+
+
+@memoized(key=lambda card_row: card_row["identity"])
+def fetch_related(cur: sqlite3.Cursor | CardCatalog, card_row: sqlite3.Row) -> list[sqlite3.Row]:
+    """Return every printing that shares ``card_row``'s functional identity, oldest first."""
+    if isinstance(cur, CardCatalog):
+        return cur.related(card_row)
+    cur.execute(RELATED_SQL, (card_row["identity"],))
+    return cur.fetchall()
+
+
+@memoized(key=lambda identity: identity)
+def _preferred_row(cur: sqlite3.Cursor, identity: str) -> sqlite3.Row | None:
+    cur.execute(PREFERRED_SQL, (identity,))
+    return cur.fetchone()
+
+
+def fetch_preferred(cur: sqlite3.Cursor | CardCatalog, card_row: sqlite3.Row) -> sqlite3.Row:
+    """The printing a deck should play in place of ``card_row`` (see ``printing_rules``)."""
+    if isinstance(cur, CardCatalog):
+        return cur.preferred(card_row)
+    return _preferred_row(cur, card_row["identity"]) or card_row
+
+
+def resolve_entries(cur: sqlite3.Cursor | CardCatalog, entries: Iterable[Hashable], with_related: bool = True) -> dict:
+    """
+    Resolve a whole decklist in three queries (two without ``with_related``).
+
+    ``entries`` are DeckEntry-like tuples with ``set_code`` and ``number``.
+    Returns ``{entry: Resolution(printing, related, preferred)}``, with ``None`` for
+    entries whose printing is not in the database.  Duplicate lines share
+    the same lookup.  ``related`` is left empty unless ``with_related``.
+    """
+    if isinstance(cur, CardCatalog):
+        result = {}
+        for entry in entries:
+            printing = cur.printing(entry.set_code, entry.number)
+            if printing is not None:
+                related = cur.related(printing) if with_related else []
+                printing = Resolution(printing, related, cur.preferred(printing))
+            result[entry] = printing
+        return result
+
+    entries = list(entries)
+    wanted = {e: (normalize_key(e.set_code), normalize_number(e.number)) for e in entries}
+
+    cur.execute(BATCH_PRINTING_SQL, (json.dumps(list(set(wanted.values()))),))
+    printings: dict[tuple[str, str], sqlite3.Row] = {}
+    for row in cur.fetchall():
+        printings.setdefault((row["set_key"], row["number"]), row)
+
+    identities = json.dumps(list({row["identity"] for row in printings.values()}))
+    related: dict[str, list[sqlite3.Row]] = {}
+    if with_related:
+        cur.execute(BATCH_RELATED_SQL, (identities,))
+        for row in cur.fetchall():
+            related.setdefault(row["identity"], []).append(row)
+
+    cur.execute(BATCH_PREFERRED_SQL, (identities,))
+    preferred = {row["identity"]: row for row in cur.fetchall()}
+
+    result = {}
+    for entry, key in wanted.items():
+        printing = printings.get(key)
+        if printing is not None:
+            identity = printing["identity"]
+            printing = Resolution(printing, related.get(identity, []), preferred.get(identity) or printing)
+        result[entry] = printing
+    return result
@@ -0,0 +1,169 @@
+"""
+Card name matching for pasted decklists.
+
+``match_name`` resolves a name as typed to a ``cards.name_key`` in one probe,
+trying in order:
+
+- alias: ``name_aliases`` maps the normalized name (case, accents, curly
+  apostrophes) to a card name (``dark energy`` -> ``darkness energy``)
+- exact: the normalized name is a card
+- prefix: the same after dropping up to two trailing words (set code, number)
+- fuzzy: the closest name sharing trigrams with it, for typos
+
+and returns a ``NameMatch`` with a confidence score, or None below
+``min_score``.  On SQLite the trigram candidates come from the ``card_names``
+FTS5 table that ``schema.upgrade`` keeps in sync with ``cards``; a
+``CardCatalog`` builds the same index in memory on first use.
+"""
+import sqlite3
+from difflib import SequenceMatcher
+from typing import NamedTuple
+
+from cache import memoized
+from catalog import CardCatalog
+from schema import normalize_key
+
+# seeded into name_aliases; rows added to the table by hand are kept
+ALIASES = {
+    "dark energy": "darkness energy",
+    "steel energy": "metal energy",
+}
+
+PREFIX_SCORE = 0.9      # a name followed by a set code / number is almost certainly that name
+MIN_SCORE = 0.75
+MAX_DROPPED_WORDS = 2
+CANDIDATES = 50
+
+NAME_EXISTS_SQL = "SELECT 1 FROM cards WHERE name_key = ? LIMIT 1"
+ALIAS_SQL = "SELECT name_key FROM name_aliases WHERE alias = ?"
+TRIGRAM_SQL = f"SELECT name_key FROM card_names WHERE card_names MATCH ? ORDER BY rank LIMIT {CANDIDATES}"
+
+QUERIES = {
+    "match_name (exact)": NAME_EXISTS_SQL,
+    "match_name (alias)": ALIAS_SQL,
+    "match_name (fuzzy)": TRIGRAM_SQL,
+}
+
+
+class NameMatch(NamedTuple):
+    name_key: str
+    score: float        # 1.0 exact/alias, PREFIX_SCORE, or the fuzzy similarity
+    how: str            # 'exact', 'alias', 'prefix' or 'fuzzy'
+
+
+def trigrams(key: str) -> set[str]:
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+def similarity(a: str, b: str) -> float:
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def _prefixes(key: str) -> list[str]:
+    """``key`` and the keys left after dropping up to MAX_DROPPED_WORDS trailing words."""
+    words = key.split(" ")
+    return [" ".join(words[:len(words) - i]) for i in range(min(MAX_DROPPED_WORDS, len(words) - 1) + 1)]
+
+
+class NameIndex:
+    """In-memory trigram index over a catalog's names (what ``card_names`` is for SQLite)."""
+
+    def __init__(self, names):
+        self.names = set(names)
+        self.by_trigram: dict[str, list[str]] = {}
+        for name in self.names:
+            for t in trigrams(name):
+                self.by_trigram.setdefault(t, []).append(name)
+
+    def candidates(self, key: str) -> list[str]:
+        counts: dict[str, int] = {}
+        for t in trigrams(key):
+            for name in self.by_trigram.get(t, ()):
+                counts[name] = counts.get(name, 0) + 1
+        return sorted(counts, key=counts.get, reverse=True)[:CANDIDATES]
+
+
+def _catalog_index(catalog: CardCatalog) -> NameIndex:
+    index = getattr(catalog, "name_index", None)
+    if index is None:
+        index = catalog.name_index = NameIndex(k for k in catalog.by_name if k)
+    return index
+
+
+def _fts_query(key: str) -> str:
+    return " OR ".join('"' + t.replace('"', '""') + '"' for t in sorted(trigrams(key)))
+
+
+def _fuzzy(keys: list[str], candidates_for) -> NameMatch | None:
+    best = None
+    for key in keys:
+        if len(key) < 3:
+            continue
+        for name in candidates_for(key):
+            score = similarity(key, name)
+            if best is None or score > best.score:
+                best = NameMatch(name, score, "fuzzy")
+    return best
+
+
+def _match(exists, alias_of, candidates_for, name: str, min_score: float) -> NameMatch | None:
+    key = normalize_key(name)
+    if not key:
+        return None
+    prefixes = _prefixes(key)
+    for i, prefix in enumerate(prefixes):
+        target = alias_of(prefix)
+        if target is not None and exists(target):
+            return NameMatch(target, 1.0 if i == 0 else PREFIX_SCORE, "alias" if i == 0 else "prefix")
+        if exists(prefix):
+            return NameMatch(prefix, 1.0 if i == 0 else PREFIX_SCORE, "exact" if i == 0 else "prefix")
+    best = _fuzzy(prefixes, candidates_for)
+    return best if best is not None and best.score >= min_score else None
+
+
+def _tables(cur: sqlite3.Cursor) -> set[str]:
+    return {row[0] for row in cur.connection.execute(
+        "SELECT name FROM sqlite_master WHERE name IN ('card_names', 'name_aliases')"
+    )}
+
+
+@memoized(key=lambda name, min_score=MIN_SCORE: (normalize_key(name), min_score))
+def _match_in_db(cur: sqlite3.Cursor, name: str, min_score: float = MIN_SCORE) -> NameMatch | None:
+    # databases not yet migrated by schema.py lack the name tables
+    tables = _tables(cur)
+
+    def exists(key):
+        return cur.execute(NAME_EXISTS_SQL, (key,)).fetchone() is not None
+
+    def alias_of(key):
+        if "name_aliases" not in tables:
+            return ALIASES.get(key)
+        row = cur.execute(ALIAS_SQL, (key,)).fetchone()
+        return row[0] if row else None
+
+    if "card_names" in tables:
+        def candidates_for(key):
+            return [row[0] for row in cur.execute(TRIGRAM_SQL, (_fts_query(key),))]
+    else:
+        # also the case when this SQLite build has no FTS5 trigram tokenizer
+        index = NameIndex(row[0] for row in cur.execute("SELECT DISTINCT name_key FROM cards") if row[0])
+        candidates_for = index.candidates
+
+    return _match(exists, alias_of, candidates_for, name, min_score)
+
+
+def match_name(cur: sqlite3.Cursor | CardCatalog, name: str, min_score: float = MIN_SCORE) -> NameMatch | None:
+    """Best ``cards.name_key`` for ``name`` as typed, or None if nothing scores ``min_score``."""
+    if isinstance(cur, CardCatalog):
+        index = _catalog_index(cur)
+        return _match(index.names.__contains__, cur.aliases.get, index.candidates, name, min_score)
+    return _match_in_db(cur, name, min_score)
+
+
+def refresh_names(conn: sqlite3.Connection) -> None:
+    """Seed ``name_aliases`` and rebuild the ``card_names`` index, inside the caller's transaction."""
+    conn.executemany("INSERT OR IGNORE INTO name_aliases VALUES (?, ?)", ALIASES.items())
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'card_names'").fetchone() is None:
+        return
+    conn.execute("DELETE FROM card_names")
+    conn.execute("INSERT INTO card_names (name_key) SELECT DISTINCT name_key FROM cards WHERE name_key IS NOT NULL")
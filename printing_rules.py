@@ -0,0 +1,159 @@
+"""
+Which printing a deck should play.
+
+``RULES`` says, per card type, how to pick among the printings that share a
+functional identity.  The rules are compiled once, on first use, into a rarity
+rank table and per-rule exclusion flags, so choosing a printing is a single
+pass with dict lookups.  ``refresh_preferred`` stores the choice for every
+identity group in ``preferred_printings``; the lookups read it from there
+instead of re-ranking a card's printings on every deck.
+"""
+import sqlite3
+from itertools import groupby
+from typing import Iterable, NamedTuple, Sequence
+
+RARITIES_ORDER = [
+    'common', 'uncommon', 'rare', 'rare holo', 'promo', 'ultra rare', 'no rarity',
+    'rainbow rare', 'rare holo ex', 'rare secret', 'shiny rare', 'holo rare v',
+    'illustration rare', 'double rare', 'rare holo gx', 'special illustration rare',
+    'holo rare vmax', 'trainer gallery holo rare', 'hyper rare', 'rare holo lv.x',
+    'trainer gallery holo rare v', 'ace spec rare', 'rare shiny gx', 'holo rare vstar',
+    'trainer gallery ultra rare', 'rare break', 'rare prism star', 'rare prime',
+    'rare holo star', 'legend', 'rare shining', 'shiny rare v or vmax', 'radiant rare',
+    'shiny ultra rare', 'trainer gallery secret rare', 'trainer gallery holo rare v or vmax',
+    'amazing rare'
+]
+
+EXCLUSION = ('shiny', 'rainbow', 'hyper')
+
+
+class Rule(NamedTuple):
+    # 'keep':   play the printing the list asked for
+    # 'latest': newest printing, restricted to ``prefer`` rarities when there are any
+    # 'rank':   highest-ranked rarity (newest on ties), skipping rarities containing
+    #           any of the ``exclude`` words; the listed printing if nothing is left
+    strategy: str
+    prefer: frozenset[str] = frozenset()
+    exclude: tuple[str, ...] = ()
+
+
+_COMMON = Rule("latest", prefer=frozenset({"uncommon", "common"}))
+
+RULES = {
+    "special energy": Rule("keep"),
+    "stadium": _COMMON,
+    "item": _COMMON,
+    "pokemon tool": _COMMON,
+    "supporter": Rule("rank", exclude=(*EXCLUSION, "gallery")),
+    "pokemon": Rule("rank", exclude=(*EXCLUSION, "ultra")),
+}
+
+DEFAULT_RULE = Rule("keep")
+
+
+class _Compiled:
+    """``RULES`` resolved against the known rarities."""
+
+    def __init__(self, rules: dict[str, Rule]):
+        self.rules = rules
+        self.rank = {rarity: i for i, rarity in enumerate(RARITIES_ORDER)}
+        # rule -> rarity -> excluded?; rarities missing from RARITIES_ORDER are added on first sight
+        self.excluded: dict[Rule, dict[str, bool]] = {
+            rule: {rarity: self._excludes(rule, rarity) for rarity in RARITIES_ORDER}
+            for rule in set(rules.values()) if rule.exclude
+        }
+
+    @staticmethod
+    def _excludes(rule: Rule, rarity: str) -> bool:
+        return any(word in rarity for word in rule.exclude)
+
+    def is_excluded(self, rule: Rule, rarity: str) -> bool:
+        flags = self.excluded[rule]
+        try:
+            return flags[rarity]
+        except KeyError:
+            flag = flags[rarity] = self._excludes(rule, rarity.strip().lower())
+            return flag
+
+
+_compiled: _Compiled | None = None
+
+
+def compiled() -> _Compiled:
+    global _compiled
+    if _compiled is None:
+        _compiled = _Compiled(RULES)
+    return _compiled
+
+
+def rarity_rank(rarity: str) -> int:
+    """Position of ``rarity`` in RARITIES_ORDER, or -1 if it is not listed."""
+    rank = compiled().rank
+    try:
+        return rank[rarity]
+    except KeyError:
+        return rank.get(rarity.strip().lower(), -1)
+
+
+def _last_max(rows: Iterable, key):
+    """Like sorting by ``key`` and taking the last row, without the sort."""
+    best, best_key = None, None
+    for row in rows:
+        k = key(row)
+        if best is None or k >= best_key:
+            best, best_key = row, k
+    return best
+
+
+def choose(card_type: str, printings: Sequence):
+    """
+    The preferred printing among ``printings`` (oldest first, as the lookups
+    return them), or None when the rule keeps whichever printing was listed.
+    """
+    rule = compiled().rules.get(card_type.lower(), DEFAULT_RULE)
+    if rule.strategy == "keep" or not printings:
+        return None
+
+    if rule.strategy == "latest":
+        preferred = [r for r in printings if r["rarity"].lower() in rule.prefer]
+        return _last_max(preferred or printings, key=lambda r: r["released"])
+
+    c = compiled()
+    return _last_max(
+        (r for r in printings if not c.is_excluded(rule, r["rarity"])),
+        key=lambda r: (rarity_rank(r["rarity"]), r["released"]),
+    )
+
+
+def choose_many(printing_groups: Iterable[Sequence]) -> list:
+    """``choose`` for each group of printings, by its first printing's card type."""
+    return [choose(group[0]["card_type"], group) if group else None for group in printing_groups]
+
+
+def select_preferred_printing(card_type: str, base_printing, related_printings: Sequence):
+    """Pick the printing to put in the deck for ``base_printing``, given every printing of the card."""
+    preferred = choose(card_type, related_printings)
+    return base_printing if preferred is None else preferred
+
+
+def refresh_preferred(conn: sqlite3.Connection) -> int:
+    """
+    Recompute ``preferred_printings`` for every identity group, inside the
+    caller's transaction.  A NULL ``card_id`` means the rule keeps the listed
+    printing.  Returns the number of groups.
+    """
+    cur = conn.cursor()
+    cur.row_factory = sqlite3.Row
+    cur.execute(
+        "SELECT rowid AS card_id, identity, card_type, rarity, released FROM cards "
+        "WHERE identity IS NOT NULL ORDER BY identity, released, rowid"
+    )
+    preferred = []
+    for identity, group in groupby(cur, key=lambda r: r["identity"]):
+        group = list(group)
+        choice = choose(group[0]["card_type"], group)
+        preferred.append((identity, None if choice is None else choice["card_id"]))
+
+    conn.execute("DELETE FROM preferred_printings")
+    conn.executemany("INSERT INTO preferred_printings VALUES (?, ?)", preferred)
+    return len(preferred)
@@ -0,0 +1,408 @@
+"""
+Schema migrations for pokemon_cards.db.
+
+The ingest notebook writes a flat, all-TEXT ``cards`` table.  ``migrate`` upgrades
+it in place: it adds pre-normalized key columns and a functional-identity hash,
+splits ``attacks``/``abilities`` into the ``card_attacks``/``card_abilities``
+child tables, records each card's preferred printing, indexes the card names
+for fuzzy matching and the card text for full-text search, and creates the
+indexes the lookup scripts rely on.  Every step is idempotent, so it is safe to
+run after each (re)ingest.
+
+    python schema.py [pokemon_cards.db] [--check]
+"""
+import hashlib
+import re
+import sqlite3
+import sys
+import unicodedata
+from typing import NamedTuple
+
+from card_text import Ability, Attack, parse_abilities, parse_attacks, parse_repr
+from database import connect_writer
+from printing_rules import refresh_preferred
+
+DB_PATH = "pokemon_cards.db"
+
+# bump whenever _backfill starts deriving something new, so existing rows are redone
+SCHEMA_VERSION = 5
+
+# key column -> source column it is derived from
+KEY_COLUMNS = {
+    "set_key": "set_name",
+    "name_key": "name",
+    "type_key": "card_type",
+}
+
+# every column _backfill fills in; all TEXT but these
+DERIVED_COLUMNS = [*KEY_COLUMNS, "identity", "released"]
+INTEGER_COLUMNS = {"released"}
+
+# ``released`` of printings without a date ('none'): after every dated one,
+# where the 'none' strings sorted in ORDER BY date
+UNDATED = 99999999
+
+TABLES = {
+    "card_attacks": """
+        card_id  INTEGER NOT NULL,  -- cards.rowid
+        position INTEGER NOT NULL,
+        name     TEXT,
+        cost     TEXT,              -- comma-separated energy types
+        damage   TEXT,
+        effect   TEXT,
+        PRIMARY KEY (card_id, position)
+    """,
+    "card_abilities": """
+        card_id  INTEGER NOT NULL,  -- cards.rowid
+        position INTEGER NOT NULL,
+        kind     TEXT,
+        name     TEXT,
+        effect   TEXT,
+        PRIMARY KEY (card_id, position)
+    """,
+}
+
+# one row per identity group, rebuilt wholesale by upgrade() rather than per card
+GROUP_TABLES = {
+    "preferred_printings": """
+        identity TEXT PRIMARY KEY,
+        card_id  INTEGER            -- cards.rowid, NULL: keep the listed printing
+    """,
+}
+
+# name lookups for names.match_name: hand-editable aliases, and a trigram
+# index of the distinct names (skipped if this SQLite lacks FTS5/trigram)
+NAME_TABLES = {
+    "name_aliases": """
+        alias    TEXT PRIMARY KEY,  -- normalize_key() of the name as typed
+        name_key TEXT NOT NULL
+    """,
+}
+
+NAME_INDEX = "CREATE VIRTUAL TABLE IF NOT EXISTS card_names USING fts5(name_key, tokenize='trigram')"
+
+# full-text index over the card text (search_text.py), one row per card keyed
+# by cards.rowid; skipped if this SQLite lacks FTS5
+SEARCH_TABLE = "card_search"
+SEARCH_FIELDS = ["name", "effect", "attacks", "abilities", "vstar_power", "tera_effect", "rule_box", "other"]
+SEARCH_INDEX = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE}
+    USING fts5({", ".join(SEARCH_FIELDS)}, tokenize='porter unicode61 remove_diacritics 2')
+"""
+SEARCH_TRIGGER = f"""
+    CREATE TRIGGER IF NOT EXISTS cards_delete_search AFTER DELETE ON cards BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.rowid;
+    END
+"""
+
+INDEXES = {
+    "idx_cards_set_number": "cards(set_key, number)",
+    "idx_cards_name_released": "cards(name_key, released)",
+    "idx_cards_identity_released": "cards(identity, released)",
+    "idx_card_attacks_name": "card_attacks(name, position)",
+    "idx_card_abilities_name": "card_abilities(name)",
+}
+
+# replaced by the indexes above
+DROPPED_INDEXES = ["idx_cards_name_type_date", "idx_cards_identity"]
+
+TRIGGERS = {
+    "cards_delete_children": """
+        AFTER DELETE ON cards BEGIN
+            DELETE FROM card_attacks WHERE card_id = old.rowid;
+            DELETE FROM card_abilities WHERE card_id = old.rowid;
+        END
+    """,
+}
+
+def normalize_key(value: str | None) -> str | None:
+    """
+    Fold a name/set/type into its lookup key: lower-case, accents stripped,
+    curly apostrophes straightened and whitespace collapsed.
+    """
+    if value is None:
+        return None
+    value = value.replace("’", "'").replace("‘", "'")
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(ch for ch in value if not unicodedata.combining(ch))
+    return " ".join(value.lower().split())
+
+
+def normalize_number(number: str) -> str:
+    """Card numbers are stored without leading zeros ('053' -> '53')."""
+    number = number.strip()
+    return str(int(number)) if number.isdigit() else number.lower()
+
+
+def release_key(date: str | None) -> int:
+    """``cards.date`` as the integer stored in ``released``: '2024-03-22' -> 20240322."""
+    if date is None or date == "none":
+        return UNDATED
+    try:
+        return int(date.replace("-", ""))
+    except ValueError:
+        return UNDATED
+
+
+def _fold_text(text: str | None) -> str:
+    if text is None or text == "none":
+        return ""
+    return " ".join(re.sub(r"[^a-z0-9+×]+", " ", normalize_key(text)).split())
+
+
+def functional_identity(
+    name: str | None,
+    card_type: str | None,
+    attacks: list[Attack],
+    abilities: list[Ability],
+    effect: str | None,
+) -> str:
+    """
+    Hash of everything that makes two printings play the same: name, type, the
+    attacks (name, cost, damage, text), abilities and card effect.  Rarity, set,
+    artwork and punctuation/casing differences in the text do not count.
+    """
+    parts = [normalize_key(name) or "", normalize_key(card_type) or ""]
+    for a in attacks:
+        parts.append(f"A:{_fold_text(a.name)}:{','.join(a.cost)}:{a.damage or ''}:{_fold_text(a.effect)}")
+    for a in abilities:
+        parts.append(f"B:{_fold_text(a.name)}:{_fold_text(a.effect)}")
+    parts.append(f"E:{_fold_text(effect)}")
+    return hashlib.blake2b("\x1f".join(parts).encode(), digest_size=8).hexdigest()
+
+
+def table_columns(conn: sqlite3.Connection, table: str = "cards") -> list[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _add_columns(conn: sqlite3.Connection, columns: dict[str, str]) -> None:
+    existing = set(table_columns(conn))
+    for column, decl in columns.items():
+        if column not in existing:
+            conn.execute(f'ALTER TABLE cards ADD COLUMN "{column}" {decl}')
+
+
+# text columns indexed for search besides effect/attacks/abilities; the last
+# four only appear on older cards and share the "other" search field
+TEXT_COLUMNS = ["vstar_power", "tera_effect", "rule_box", "ancient_trait", "poke_power", "poke_body", "held_item"]
+
+# cards columns _backfill derives from, in derive()'s argument order
+SOURCE_COLUMNS = [*KEY_COLUMNS.values(), "attacks", "abilities", "effect", "date", *TEXT_COLUMNS]
+
+BACKFILL_BATCH = 2000
+
+
+class Derived(NamedTuple):
+    columns: tuple          # DERIVED_COLUMNS values
+    attacks: list[tuple]    # card_attacks rows without card_id
+    abilities: list[tuple]  # card_abilities rows without card_id
+    search: tuple           # card_search row (SEARCH_FIELDS) without rowid
+
+
+def _plain_text(raw: str | None) -> str:
+    """The words of a stored text column; list/dict reprs contribute their values, not their keys."""
+    if raw is None or raw == "none":
+        return ""
+    if raw[:1] not in "[{":
+        return raw
+    parts = []
+
+    def walk(value):
+        if isinstance(value, dict):
+            for v in value.values():
+                walk(v)
+        elif isinstance(value, list):
+            for v in value:
+                walk(v)
+        elif isinstance(value, str):
+            parts.append(value)
+
+    walk(parse_repr(raw))
+    return " ".join(parts)
+
+
+def derive(set_name, name, card_type, raw_attacks, raw_abilities, effect, date, *text) -> Derived:
+    """Everything ``migrate`` derives for one card, from its stored source columns."""
+    card_attacks = parse_attacks(raw_attacks)
+    card_abilities = parse_abilities(raw_abilities)
+    identity = functional_identity(name, card_type, card_attacks, card_abilities, effect)
+    text = [_plain_text(t) for t in text] + [""] * (len(TEXT_COLUMNS) - len(text))
+    return Derived(
+        (normalize_key(set_name), normalize_key(name), normalize_key(card_type), identity, release_key(date)),
+        [(a.position, a.name, ",".join(a.cost), a.damage, a.effect) for a in card_attacks],
+        [(a.position, a.kind, a.name, a.effect) for a in card_abilities],
+        (
+            name or "",
+            _plain_text(effect),
+            " ".join(f"{a.name} {a.effect or ''}" for a in card_attacks),
+            " ".join(f"{a.name} {a.effect or ''}" for a in card_abilities),
+            *text[:3],
+            " ".join(t for t in text[3:] if t),
+        ),
+    )
+
+
+def has_search_index(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (SEARCH_TABLE,)).fetchone() is not None
+
+
+def write_children(conn: sqlite3.Connection, derived: list[tuple[int, Derived]]) -> None:
+    """Insert the attack/ability rows and search index entries of ``(card_id, Derived)`` pairs."""
+    conn.executemany(
+        "INSERT INTO card_attacks VALUES (?, ?, ?, ?, ?, ?)",
+        ((card_id, *row) for card_id, d in derived for row in d.attacks),
+    )
+    conn.executemany(
+        "INSERT INTO card_abilities VALUES (?, ?, ?, ?, ?)",
+        ((card_id, *row) for card_id, d in derived for row in d.abilities),
+    )
+    if has_search_index(conn):
+        conn.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(SEARCH_FIELDS)}) "
+            f"VALUES (?, {', '.join('?' * len(SEARCH_FIELDS))})",
+            ((card_id, *d.search) for card_id, d in derived),
+        )
+
+
+def write_derived(conn: sqlite3.Connection, derived: list[tuple[int, Derived]]) -> None:
+    """Store ``(card_id, Derived)`` pairs on existing cards, replacing any child rows already there."""
+    for table in TABLES:
+        conn.executemany(f"DELETE FROM {table} WHERE card_id = ?", ((card_id,) for card_id, _ in derived))
+    if has_search_index(conn):
+        conn.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = ?", ((card_id,) for card_id, _ in derived))
+    write_children(conn, derived)
+    assignments = ", ".join(f"{col} = ?" for col in DERIVED_COLUMNS)
+    conn.executemany(
+        f"UPDATE cards SET {assignments} WHERE rowid = ?",
+        ((*d.columns, card_id) for card_id, d in derived),
+    )
+
+
+def _backfill(conn: sqlite3.Connection) -> int:
+    """Derive key columns and child rows for cards the ingest has just written."""
+    columns = set(table_columns(conn))
+    select = ", ".join(col if col in columns else "NULL" for col in SOURCE_COLUMNS)
+
+    # a rebuilt cards table reuses rowids, so clear whatever the old rows left behind
+    for table in TABLES:
+        conn.execute(f"DELETE FROM {table} WHERE card_id NOT IN (SELECT rowid FROM cards)")
+    if has_search_index(conn):
+        conn.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid NOT IN (SELECT rowid FROM cards)")
+
+    count, last = 0, 0
+    while True:
+        rows = conn.execute(
+            f"SELECT rowid, {select} FROM cards WHERE set_key IS NULL AND rowid > ? ORDER BY rowid LIMIT ?",
+            (last, BACKFILL_BATCH),
+        ).fetchall()
+        if not rows:
+            return count
+        write_derived(conn, [(row[0], derive(*row[1:])) for row in rows])
+        count += len(rows)
+        last = rows[-1][0]
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    """Create the derived columns, child tables and triggers (not the indexes) if missing."""
+    _add_columns(conn, {col: "INTEGER" if col in INTEGER_COLUMNS else "TEXT" for col in DERIVED_COLUMNS})
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        # the reset rows are backfilled by upgrade() in the same transaction
+        conn.execute("UPDATE cards SET set_key = NULL")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    for name, definition in {**TABLES, **GROUP_TABLES, **NAME_TABLES}.items():
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {name} ({definition})")
+    try:
+        conn.execute(NAME_INDEX)
+    except sqlite3.OperationalError:
+        pass    # names.match_name falls back to an in-memory index
+    if not has_search_index(conn):
+        try:
+            conn.execute(SEARCH_INDEX)
+        except sqlite3.OperationalError:
+            pass    # no FTS5: search_text.py is unavailable, lookups are unaffected
+        else:
+            # index every existing card, not just the ones written from now on
+            conn.execute("UPDATE cards SET set_key = NULL")
+    if has_search_index(conn):
+        conn.execute(SEARCH_TRIGGER)
+    for name, definition in TRIGGERS.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {definition}")
+
+
+def upgrade(conn: sqlite3.Connection) -> int:
+    """
+    Bring the database up to the current schema and backfill rows written since
+    the last run, inside the caller's transaction.  Returns the number of cards
+    backfilled.
+    """
+    from names import refresh_names
+
+    ensure_schema(conn)
+    count = _backfill(conn)
+
+    for name in DROPPED_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    for name, definition in INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+    refresh_preferred(conn)
+    refresh_names(conn)
+    return count
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """``upgrade`` in its own transaction, then refresh the planner statistics."""
+    with conn:
+        count = upgrade(conn)
+    conn.execute("ANALYZE")
+    return count
+
+
+def check_query_plans(conn: sqlite3.Connection) -> list[tuple[str, str]]:
+    """
+    Run EXPLAIN QUERY PLAN over every lookup query and return the
+    (label, plan step) pairs that fall back to a full table scan.
+    """
+    import interpret
+    import lookup
+    import names
+    import search_text
+
+    queries = dict(lookup.QUERIES)
+    queries.update(interpret.QUERIES)
+    queries.update(names.QUERIES)
+    if has_search_index(conn):
+        queries.update(search_text.QUERIES)
+
+    scans = []
+    for label, sql in queries.items():
+        params = ("",) * sql.count("?")
+        for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params):
+            detail = row[-1]
+            # scanning a json_each() parameter list is fine, scanning a table is not
+            if detail.startswith("SCAN") and "VIRTUAL TABLE" not in detail:
+                scans.append((label, detail))
+    return scans
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    db_path = args[0] if args else DB_PATH
+
+    conn = connect_writer(db_path)
+    count = migrate(conn)
+    print(f"Migrated {db_path} ({count} new cards)")
+
+    scans = []
+    if "--check" in sys.argv:
+        scans = check_query_plans(conn)
+        for label, detail in scans:
+            print(f"FULL SCAN in {label}: {detail}")
+        if not scans:
+            print("All lookups use an index.")
+    conn.close()
+    if scans:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,107 +1,8 @@
-import re
 import sqlite3
-from typing import Iterable, List, NamedTuple
 
-RARITIES_ORDER = [
-    'common', 'uncommon', 'rare', 'rare holo', 'promo', 'ultra rare', 'no rarity',
-    'rainbow rare', 'rare holo ex', 'rare secret', 'shiny rare', 'holo rare v',
-    'illustration rare', 'double rare', 'rare holo gx', 'special illustration rare',
-    'holo rare vmax', 'trainer gallery holo rare', 'hyper rare', 'rare holo lv.x',
-    'trainer gallery holo rare v', 'ace spec rare', 'rare shiny gx', 'holo rare vstar',
-    'trainer gallery ultra rare', 'rare break', 'rare prism star', 'rare prime',
-    'rare holo star', 'legend', 'rare shining', 'shiny rare v or vmax', 'radiant rare',
-    'shiny ultra rare', 'trainer gallery secret rare', 'trainer gallery holo rare v or vmax',
-    'amazing rare'
-]
-EXCLUSION = ['shiny', 'rainbow', 'hyper']
-SUPPORT_EXCLUSION = EXCLUSION + ['gallery']
-POKEMON_EXCLUSION = EXCLUSION + ['ultra']
-
-LINE_RE = re.compile(r"""
-    ^\s*
-    (\d+)\s+          # quantity
-    (.*?)\s+          # card name
-    ([A-Z0-9]+)\s+    # set code
-    (\d+)\s*          # card number
-    $
-""", re.VERBOSE)
-
-class DeckEntry(NamedTuple):
-    quantity: int
-    name: str
-    set_code: str
-    number: str
-    raw_line: str
-
-
-def parse_decklist(lines: Iterable[str]) -> tuple[List[DeckEntry], List[str]]:
-    entries: List[DeckEntry] = []
-    basic_energies: List[str] = []
-
-    for raw in lines:
-        line = raw.strip()
-        if not line or not line[0].isdigit():
-            continue
-        if line.lower().split(' ')[-2] == "energy":
-            basic_energies.append(line)
-            continue
-
-        match = LINE_RE.match(line)
-        if not match:
-            continue
-        qty_str, name, set_code, card_no = match.groups()
-        entries.append(DeckEntry(int(qty_str), name.strip(), set_code, card_no, raw))
-
-    return entries, basic_energies
-
-
-def get_rarity_rank(rarity: str) -> int:
-    rarity = rarity.strip().lower()
-    try:
-        return RARITIES_ORDER.index(rarity)
-    except ValueError:
-        return -1
-
-
-def contains_any(string: str, words: list[str]) -> bool:
-    s = string.lower()
-    return any(w.lower() in s for w in words)
-
-
-def select_preferred_printing(
-    card_type: str,
-    base_printing: sqlite3.Row,
-    related_printings: list[sqlite3.Row]
-) -> sqlite3.Row:
-    ctype = card_type.lower()
-
-    if ctype == "special energy":
-        return base_printing
-
-    if ctype in ["stadium", "item", "pokemon tool"]:
-        uncommons = [r for r in related_printings if r["rarity"].lower() in ["uncommon", "common"]]
-        if uncommons:
-            uncommons.sort(key=lambda r: r["date"])
-            return uncommons[-1]
-        else:
-            related_printings.sort(key=lambda r: r["date"])
-            return related_printings[-1]
-
-    if ctype == "supporter":
-        filtered = [r for r in related_printings if not contains_any(r["rarity"], SUPPORT_EXCLUSION)]
-        if not filtered:
-            return base_printing
-        filtered.sort(key=lambda r: (get_rarity_rank(r["rarity"]), r["date"]))
-        return filtered[-1]
-
-    if ctype == "pokemon":
-        filtered = [r for r in related_printings if not contains_any(r["rarity"], POKEMON_EXCLUSION)]
-        if not filtered:
-            return base_printing
-        filtered.sort(key=lambda r: (get_rarity_rank(r["rarity"]), r["date"]))
-        return filtered[-1]
-
-    return base_printing
+from database import connect_reader
+from decklist import parse_decklist
+from lookup import resolve_entries
 
 
 def print_option(idx: int, row: sqlite3.Row) -> None:
@@ -147,62 +48,19 @@ Trainer - 34
     lines = deck_text.strip().splitlines()
     entries, basic_energy_lines = parse_decklist(lines)
 
-    conn = sqlite3.connect("pokemon_cards.db")
+    conn = connect_reader("pokemon_cards.db")
     conn.row_factory = sqlite3.Row
     cur = conn.cursor()
 
     deck_counts: dict[tuple[str, str, str, str], int] = {}
 
-    def fetch_printing(set_code: str, card_no: str) -> sqlite3.Row | None:
-        cur.execute(
-            "SELECT * FROM cards WHERE lower(set_name) = ? AND number = ? LIMIT 1",
-            (set_code.lower(), card_no),
-        )
-        return cur.fetchone()
-
-    def fetch_related(card_row: sqlite3.Row) -> list[sqlite3.Row]:
-        ctype = card_row["card_type"].lower()
-
-        if ctype == "pokemon":
-            first_attack = ""
-            raw = card_row["attacks"]
-            
-            first_attack = raw.split("e': '", 1)[1].split("'", 1)[0]
-
-            cur.execute(
-                """
-                SELECT *
-                FROM cards
-                WHERE name            = ?
-                    AND lower(card_type) = 'pokemon'
-                    AND lower(attacks)   LIKE ?
-                ORDER BY julianday(date) ASC
-                """,
-                (card_row["name"], f"%{first_attack}%"),
-            )
-        
-        else:
-            cur.execute(
-                """
-                SELECT *
-                FROM cards
-                WHERE name              = ?
-                AND lower(card_type)  = ?
-                ORDER BY julianday(date) ASC
-                """,
-                (card_row["name"], ctype),
-            )
-
-        return cur.fetchall()
-
-
+    resolved = resolve_entries(cur, entries)
     for entry in entries:
-        base = fetch_printing(entry.set_code, entry.number)
-        if not base:
+        if resolved[entry] is None:
             print(f"Warning: Base printing not found for {entry.name} {entry.set_code} {entry.number}")
             continue
 
-        related = fetch_related(base)
+        base, related, default_row = resolved[entry]
         options = list(related)
         if base not in related:
             options.append(base)
@@ -220,7 +78,6 @@ Trainer - 34
         for idx, opt in enumerate(options, 1):
             print_option(idx, opt)
 
-        default_row = select_preferred_printing(base["card_type"], base, options)
         default_idx = options.index(default_row) + 1
         if len(options) == 1:
             choice = '1'
@@ -0,0 +1,156 @@
+"""
+Full-text search over card text.
+
+Queries the ``card_search`` FTS5 index that ``schema.migrate`` and the ingest
+keep over each card's name, effect, attacks, abilities, VSTAR power, tera
+effect, rule box and older power/body texts.  Words are stemmed, so "discard
+energy draw" also finds "discards" and "drawing"; results are ranked by BM25
+and, by default, one printing is shown per functional card.
+
+    python search_text.py "discard energy draw" [--regulation g,h,i]
+                          [--type pokemon,supporter] [--any] [--all-printings] [--limit 20]
+"""
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import time
+from typing import Iterable, NamedTuple
+
+from database import connect_reader
+from schema import SEARCH_FIELDS, SEARCH_TABLE, has_search_index, normalize_key
+
+DB_PATH = "pokemon_cards.db"
+
+# name hits count most, the rule box (the same boilerplate on every ex/V) least
+WEIGHTS = {"name": 5.0, "rule_box": 0.5}
+
+# ranks every match, so it selects as little as possible; the snippets are
+# only built for the hits that are returned (HITS_SQL)
+SEARCH_SQL = f"""
+    SELECT c.rowid, c.identity,
+           bm25({SEARCH_TABLE}, {", ".join(str(WEIGHTS.get(f, 1.0)) for f in SEARCH_FIELDS)}) AS score
+    FROM {SEARCH_TABLE}
+    JOIN cards c ON c.rowid = {SEARCH_TABLE}.rowid
+    WHERE {SEARCH_TABLE} MATCH ?
+      AND (? IS NULL OR c.regulation IN (SELECT value FROM json_each(?)))
+      AND (? IS NULL OR c.type_key IN (SELECT value FROM json_each(?)))
+    ORDER BY score, c.released DESC
+"""
+
+HITS_SQL = f"""
+    SELECT c.rowid AS card_id, c.name, c.set_name, c.number, c.card_type, c.regulation, c.date, c.identity,
+           snippet({SEARCH_TABLE}, -1, '[', ']', '...', 12) AS snippet
+    FROM {SEARCH_TABLE}
+    JOIN cards c ON c.rowid = {SEARCH_TABLE}.rowid
+    WHERE {SEARCH_TABLE} MATCH ? AND {SEARCH_TABLE}.rowid IN (SELECT value FROM json_each(?))
+"""
+
+QUERIES = {
+    "search_cards": SEARCH_SQL,
+    "search_cards (hits)": HITS_SQL,
+}
+
+_WORD_RE = re.compile(r"[\w']+\*?")
+
+
+class Hit(NamedTuple):
+    card_id: int
+    name: str
+    set_name: str
+    number: str
+    card_type: str
+    regulation: str
+    date: str
+    identity: str
+    snippet: str
+    score: float        # BM25, lower is better
+
+
+def fts_query(text: str, any_word: bool = False) -> str:
+    """
+    Turn free text into an FTS5 query: every word quoted (so punctuation and
+    FTS keywords are literal), a trailing ``*`` kept as a prefix search, and the
+    words ANDed (or ORed with ``any_word``).
+    """
+    terms = []
+    for word in _WORD_RE.findall(normalize_key(text) or ""):
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return (" OR " if any_word else " ").join(terms)
+
+
+def _filter(values: Iterable[str] | None) -> tuple:
+    if not values:
+        return None, None
+    values = json.dumps([normalize_key(v) for v in values])
+    return values, values
+
+
+def search_cards(
+    cur: sqlite3.Cursor,
+    text: str,
+    regulations: Iterable[str] | None = None,
+    card_types: Iterable[str] | None = None,
+    limit: int = 20,
+    any_word: bool = False,
+    all_printings: bool = False,
+) -> list[Hit]:
+    """Best-matching cards for ``text``; one printing (the newest) per functional card unless ``all_printings``."""
+    query = fts_query(text, any_word)
+    if not query:
+        return []
+    cur.execute(SEARCH_SQL, (query, *_filter(regulations), *_filter(card_types)))
+
+    ranked, seen = {}, set()
+    for rowid, identity, score in cur:
+        if not all_printings:
+            if identity in seen:
+                continue
+            seen.add(identity)
+        ranked[rowid] = score
+        if len(ranked) == limit:
+            break
+
+    cur.execute(HITS_SQL, (query, json.dumps(list(ranked))))
+    order = {rowid: i for i, rowid in enumerate(ranked)}
+    hits = [Hit(*row, ranked[row[0]]) for row in cur.fetchall()]
+    hits.sort(key=lambda hit: order[hit.card_id])
+    return hits
+
+
+def _split(value: str | None) -> list[str] | None:
+    return [v.strip() for v in value.split(",") if v.strip()] if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search card text")
+    parser.add_argument("query", help='words to find, e.g. "discard energy draw"; end a word with * for a prefix')
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--regulation", help="comma-separated regulation marks, e.g. g,h,i")
+    parser.add_argument("--type", help="comma-separated card types, e.g. pokemon,supporter")
+    parser.add_argument("--any", action="store_true", help="match any word instead of all of them")
+    parser.add_argument("--all-printings", action="store_true", help="list every printing, not one per card")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    conn = connect_reader(args.db)
+    if not has_search_index(conn):
+        sys.exit(f"{args.db} has no {SEARCH_TABLE} index; run `python schema.py {args.db}` first")
+    start = time.perf_counter()
+    hits = search_cards(conn.cursor(), args.query, _split(args.regulation), _split(args.type),
+                        args.limit, args.any, args.all_printings)
+    elapsed = time.perf_counter() - start
+    conn.close()
+
+    for hit in hits:
+        print(f"{hit.name} | {hit.set_name.upper()} {hit.number} | {hit.card_type} | {hit.regulation} | {hit.date}")
+        print(f"    {' '.join(hit.snippet.split())}")
+    print(f"{len(hits)} results in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
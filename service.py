@@ -0,0 +1,159 @@
+"""
+Resident deck resolution service.
+
+Keeps the card data open between requests instead of connecting per run, and
+exposes the scripts' pipelines over HTTP/JSON:
+
+    POST /rewrite   raw decklist text (or {"decklist": "..."})
+                    -> search_special's rewrite to preferred printings
+    POST /compile   interpret.py-style dict {"Card Name SET": [count, "Pokemon"], ...}
+                    -> interpret's set/number resolution
+    GET  /health
+    GET  /stats     lookup cache counters (see cache.py), and per-query totals with --instrument
+    GET  /metrics   the same in the Prometheus text format (see instrument.py)
+
+Requests are served concurrently.  By default they share one read-only
+``CardCatalog`` (``snapshot.CatalogSource``); with ``--pool N`` each request
+borrows one of N read-only SQLite connections instead.  Either is reopened
+when an ingest swaps in a new database.  ``--instrument`` times the pool's
+statements and logs those over ``--slow-ms``.
+
+    python service.py [--db pokemon_cards.db] [--host 127.0.0.1] [--port 8080] [--pool N]
+                      [--cache-size 4096] [--cache-ttl SECONDS]
+                      [--instrument [--slow-ms 50] [--slow-log slow.jsonl]]
+"""
+import argparse
+import functools
+import json
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import instrument
+from cache import LOOKUP_CACHE
+from database import ConnectionPool, connect_reader
+from interpret import compile_deck, format_deck
+from search_special import rewrite_decklist
+from snapshot import CatalogSource
+
+DB_PATH = "pokemon_cards.db"
+
+
+def rewrite_request(source, text: str) -> dict:
+    with source.cursor() as cur:
+        decklist, unresolved = rewrite_decklist(cur, text.strip().splitlines())
+    return {"decklist": decklist, "unresolved": [e.raw_line.strip() for e in unresolved]}
+
+
+def compile_request(source, deck: dict) -> dict:
+    with source.cursor() as cur:
+        groups = compile_deck(deck, cursor=cur)
+    return {"groups": groups, "decklist": format_deck(groups)}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, so load tests measure lookups rather than handshakes
+    disable_nagle_algorithm = True  # headers and body are separate writes; don't stall on delayed ACKs
+    source = None                   # set by serve()
+    quiet = False
+
+    def _send(self, status: int, payload: dict | str) -> None:
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, content_type = json.dumps(payload, ensure_ascii=False).encode(), "application/json; charset=utf-8"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {"status": "ok"})
+        elif self.path == "/stats":
+            self._send(200, {"lookup_cache": LOOKUP_CACHE.stats(), "queries": instrument.METRICS.snapshot()})
+        elif self.path == "/metrics":
+            self._send(200, instrument.METRICS.prometheus())
+        else:
+            self._send(404, {"error": f"no such endpoint: {self.path}"})
+
+    def do_POST(self):
+        body = self._body()
+        try:
+            if self.path == "/rewrite":
+                text = body.decode()
+                if "json" in (self.headers.get("Content-Type") or ""):
+                    text = json.loads(text)["decklist"]
+                self._send(200, rewrite_request(self.source, text))
+            elif self.path == "/compile":
+                deck = json.loads(body)
+                if not isinstance(deck, dict):
+                    raise ValueError("Expected a dict of cards")
+                self._send(200, compile_request(self.source, deck))
+            else:
+                self._send(404, {"error": f"no such endpoint: {self.path}"})
+        except (ValueError, KeyError, TypeError) as e:
+            self._send(400, {"error": f"bad request: {e}"})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def serve(db_path: str = DB_PATH, host: str = "127.0.0.1", port: int = 8080,
+          pool: int = 0, quiet: bool = False, instrumented: bool = False) -> None:
+    start = time.perf_counter()
+    if pool:
+        connect = functools.partial(instrument.connect, opener=connect_reader) if instrumented else connect_reader
+        source = ConnectionPool(db_path, pool, connect)
+    else:
+        source = CatalogSource(db_path)
+    handler = type("BoundHandler", (Handler,), {"source": source, "quiet": quiet})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    backend = f"{pool} read-only connections" if pool else "in-memory catalog"
+    sys.stderr.write(
+        f"Serving {db_path} ({backend}, ready in {(time.perf_counter() - start) * 1000:.0f} ms) "
+        f"on http://{host}:{server.server_address[1]}\n"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        source.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--pool", type=int, default=0,
+                        help="serve from N read-only SQLite connections instead of the in-memory catalog")
+    parser.add_argument("--cache-size", type=int, default=LOOKUP_CACHE.maxsize,
+                        help="entries in the SQLite lookup cache (used with --pool)")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="seconds a cached lookup stays valid")
+    parser.add_argument("--quiet", action="store_true", help="do not log each request")
+    parser.add_argument("--instrument", action="store_true",
+                        help="time every statement on the --pool connections (served at /metrics)")
+    parser.add_argument("--slow-ms", type=float, default=50.0, help="log statements slower than this")
+    parser.add_argument("--slow-log", help="file for the slow-query log (default: stderr)")
+    args = parser.parse_args()
+    if args.instrument and not args.pool:
+        parser.error("--instrument needs --pool; the in-memory catalog runs no SQL")
+    LOOKUP_CACHE.configure(maxsize=args.cache_size, ttl=args.cache_ttl)
+    instrument.METRICS.slow_ms = args.slow_ms
+    instrument.METRICS.slow_log = args.slow_log
+    serve(args.db, args.host, args.port, args.pool, args.quiet, args.instrument)
+
+
+if __name__ == "__main__":
+    main()
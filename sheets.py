@@ -0,0 +1,208 @@
+"""
+Prompt sheets for several formats and budgets in one pass.
+
+Each ``SheetSpec`` names an output file, the regulation marks and card types
+it covers and its encoding:
+
+- ``pipe``: the ``short.py`` cards.txt format, with its prompt
+- ``min``: the same fields with shorter attack notation, for tight token budgets
+- ``jsonl``: one JSON object per card, for tooling
+
+``export_sheets`` reads the cards in the union of the specs once, picks each
+sheet's printings as the rows go by (``short.SheetBuilder``) and writes every
+sheet, skipping those already exported from the same data.  Each sheet's
+estimated token count is reported with it.
+
+    python sheets.py --sheet standard.txt:g,h,i --sheet pokemon.jsonl:g,h,i:pokemon:jsonl
+                     [--db pokemon_cards.db] [--no-cache]
+
+A sheet is ``PATH[:REGULATIONS[:TYPES[:ENCODING]]]``; the regulations default
+to those of cards.txt, the types to all, the encoding to ``pipe``.
+"""
+import argparse
+import json
+import time
+from typing import NamedTuple
+
+from database import signature
+from short import (ENERGY_TO_LETTER, LEGAL_REGULATIONS, PIPE, SUFFIX, Encoding, SheetBuilder, SheetStats,
+                   current_sheet, iter_cards, sheet_name, short_types, shorten_energy_names, write_sheet)
+
+DB_PATH = "pokemon_cards.db"
+
+# type filters that stand for several card types
+TYPE_GROUPS = {
+    'trainer': ('item', 'supporter', 'stadium', 'pokemon tool'),
+}
+
+
+class SheetSpec(NamedTuple):
+    out_path: str
+    regulations: frozenset[str] = frozenset(LEGAL_REGULATIONS)
+    card_types: frozenset[str] | None = None    # card_type values or TYPE_GROUPS keys; None for all
+    encoding: str = 'pipe'
+
+
+class SheetReport(NamedTuple):
+    out_path: str
+    encoding: str
+    cards: int
+    formatted: int      # lines written by this export; 0 if the sheet was already current
+    tokens: int         # estimated
+
+
+def _present(value) -> bool:
+    return bool(value) and str(value).lower() != 'none'
+
+
+def _attack_min(attack) -> str:
+    # "LCC Thunderbolt 200:Discard all Energy from this Pokemon."
+    cost = ''.join(ENERGY_TO_LETTER.get(c.lower(), c[:1].upper()) for c in attack.cost)
+    s = f"{cost} {attack.name}" if cost else attack.name
+    if attack.damage:
+        s += f" {attack.damage}"
+    if attack.effect:
+        s += f":{shorten_energy_names(attack.effect)}"
+    return s
+
+
+def format_min(c, show_number: bool) -> str:
+    """``short.format_card`` with terse attacks and no ``cost:``/``name:`` labels."""
+    s = [sheet_name(c, show_number)]
+    if c['rarity'] == 'ace spec rare':
+        s.append('ace spec')
+    if _present(c['hp']):
+        s.append(f"HP:{c['hp']}")
+    types = short_types(c)
+    if types:
+        s.append(f"T:{types}")
+    if _present(c['effect']):
+        s.append(f"E:{c['effect']}")
+    if _present(c['vstar_power']):
+        s.append(f"V:{c['vstar_power']}")
+    s += [f"AB:{a.effect}" for a in c['ability_list'] if a.effect]
+    s += [f"A:{_attack_min(a)}" for a in c['attack_list']]
+    if c['retreat'] is not None and str(c['retreat']).lower() not in ('none', '1'):
+        s.append(f"R:{c['retreat']}")
+    if _present(c['evolve_from']):
+        s.append(f"F:{c['evolve_from']}")
+    return '|'.join(s).replace('\n', '\\')
+
+
+def format_json(c, show_number: bool) -> str:
+    """The card as one JSON object; empty fields are left out."""
+    record = {'name': sheet_name(c, show_number), 'card_type': c['card_type']}
+    if c['rarity'] == 'ace spec rare':
+        record['ace_spec'] = True
+    for field in ('hp', 'effect', 'vstar_power', 'evolve_from'):
+        if _present(c[field]):
+            record[field] = c[field]
+    types = short_types(c)
+    if types:
+        record['types'] = types
+    abilities = [a.effect for a in c['ability_list'] if a.effect]
+    if abilities:
+        record['abilities'] = abilities
+    if c['attack_list']:
+        record['attacks'] = [
+            {k: v for k, v in (
+                ('cost', ''.join(ENERGY_TO_LETTER.get(x.lower(), x[:1].upper()) for x in a.cost)),
+                ('name', a.name), ('damage', a.damage), ('effect', a.effect),
+            ) if v}
+            for a in c['attack_list']
+        ]
+    if _present(c['retreat']):
+        record['retreat'] = int(c['retreat']) if str(c['retreat']).isdigit() else c['retreat']
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+
+
+ENCODINGS = {
+    'pipe': PIPE,
+    'min': Encoding(
+        'min', format_min,
+        SUFFIX.replace("A:Attacks(C:Cost,N:Name,E:Effect,D:Damage,S:Suffix)",
+                       "A:Attack as Cost Name Damage:Effect"),
+    ),
+    'jsonl': Encoding('jsonl', format_json, ''),
+}
+
+
+def _types(card_types) -> frozenset[str] | None:
+    if card_types is None:
+        return None
+    expanded = set()
+    for t in card_types:
+        expanded.update(TYPE_GROUPS.get(t.lower(), (t.lower(),)))
+    return frozenset(expanded)
+
+
+def export_sheets(specs: list[SheetSpec], db_path: str = DB_PATH, catalog=None,
+                  cache: bool = True) -> list[SheetReport]:
+    """
+    Write every sheet in ``specs`` from one read of the cards; a ``SheetReport``
+    per spec.  With ``cache``, sheets already written from the database as it
+    is now (``short.current_sheet``) are left alone, and if all are, the cards
+    are not read at all.  A ``catalog`` may predate the file, so its sheets are
+    always written.
+    """
+    for spec in specs:
+        if spec.encoding not in ENCODINGS:
+            raise ValueError(f"unknown encoding {spec.encoding!r}; expected one of {', '.join(ENCODINGS)}")
+    filters = [(frozenset(r.lower() for r in spec.regulations), _types(spec.card_types)) for spec in specs]
+    generation = signature(db_path) if cache and catalog is None else None
+    sources = [(generation, tuple(sorted(regs)), tuple(sorted(types)) if types is not None else None)
+               if generation is not None else None for regs, types in filters]
+    current = [current_sheet(spec.out_path, source, ENCODINGS[spec.encoding])
+               for spec, source in zip(specs, sources)]
+
+    pending = [i for i, stats in enumerate(current) if stats is None]
+    builders = {i: SheetBuilder() for i in pending}
+    if pending:
+        regulations = sorted(set().union(*(filters[i][0] for i in pending)))
+        cards = catalog.select(set(regulations)) if catalog is not None else iter_cards(db_path, regulations)
+        for c in cards:
+            for i, builder in builders.items():
+                regs, types = filters[i]
+                if c['regulation'] in regs and (types is None or c['card_type'] in types):
+                    builder.add(c)
+
+    reports = []
+    for i, spec in enumerate(specs):
+        stats: SheetStats = current[i] or write_sheet(builders[i].entries(), spec.out_path, sources[i],
+                                                      ENCODINGS[spec.encoding])
+        reports.append(SheetReport(spec.out_path, spec.encoding, *stats))
+    return reports
+
+
+def parse_spec(text: str) -> SheetSpec:
+    """``PATH[:REGULATIONS[:TYPES[:ENCODING]]]``, lists comma-separated."""
+    path, *rest = text.split(':')
+    rest += [''] * (3 - len(rest))
+    regulations, types, encoding = rest[:3]
+    return SheetSpec(
+        path,
+        frozenset(r.strip().lower() for r in regulations.split(',') if r.strip()) or frozenset(LEGAL_REGULATIONS),
+        frozenset(t.strip().lower() for t in types.split(',') if t.strip()) or None,
+        encoding.strip().lower() or 'pipe',
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write prompt sheets for several formats in one pass")
+    parser.add_argument("--sheet", action="append", type=parse_spec, required=True,
+                        metavar="PATH[:REGULATIONS[:TYPES[:ENCODING]]]",
+                        help=f"a sheet to write; encodings: {', '.join(ENCODINGS)}")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--no-cache", action="store_true", help="rewrite every sheet, even those already current")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    reports = export_sheets(args.sheet, args.db, cache=not args.no_cache)
+    elapsed = time.perf_counter() - start
+    for r in reports:
+        print(f"{r.out_path}: {r.cards} cards ({r.formatted} reformatted), ~{r.tokens} tokens [{r.encoding}]")
+    print(f"Wrote {len(reports)} sheets in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
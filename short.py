@@ -1,5 +1,15 @@
+import json
+import marshal
+import os
 import sqlite3
 import re
+import time
+from contextlib import suppress
+from typing import Callable, NamedTuple
+
+from card_text import Attack, abilities_for, attacks_for
+from database import connect_reader, signature
+from printing_rules import RARITIES_ORDER, rarity_rank
 
 SUFFIX = '''===
 Format:
@@ -57,18 +67,6 @@ ONLYDECK (No Explanations, only return json): Y
 ===
 Create a deck with the characteristics: '''  
 
-RARITIES_ORDER = [
-    'common', 'uncommon', 'rare', 'rare holo', 'promo', 'ultra rare', 'no rarity',
-    'rainbow rare', 'rare holo ex', 'rare secret', 'shiny rare', 'holo rare v',
-    'illustration rare', 'double rare', 'rare holo gx', 'special illustration rare',
-    'holo rare vmax', 'trainer gallery holo rare', 'hyper rare', 'rare holo lv.x',
-    'trainer gallery holo rare v', 'ace spec rare', 'rare shiny gx', 'holo rare vstar',
-    'trainer gallery ultra rare', 'rare break', 'rare prism star', 'rare prime',
-    'rare holo star', 'legend', 'rare shining', 'shiny rare v or vmax', 'radiant rare',
-    'shiny ultra rare', 'trainer gallery secret rare', 'trainer gallery holo rare v or vmax',
-    'amazing rare'
-]
-
 SHORTENED_ENERGY = {
     'grass': 'g',
     'fire': 'r',
@@ -82,130 +80,257 @@ SHORTENED_ENERGY = {
 }
 
 ENERGY_TO_LETTER = {k: v.upper() for k, v in SHORTENED_ENERGY.items()}
+ENERGY_RE = re.compile(rf"\b({'|'.join(ENERGY_TO_LETTER)})\b", re.IGNORECASE)
+
+LEGAL_REGULATIONS = ('g', 'h', 'i', 'f')
+CARD_COLUMNS = ("name, set_name, types, number, hp, effect, retreat, evolve_from, rarity, card_type, vstar_power, "
+                "regulation, identity")
+
+# bump when a line format changes, so sheets written in the old format are rebuilt
+LINE_FORMAT = 2
+BATCH_SIZE = 500
+
+# rough BPE-style pieces: short letter runs, up to 3 digits, single punctuation
+TOKEN_RE = re.compile(r"[A-Za-z]{1,6}|\d{1,3}|[^\sA-Za-z\d]")
+
+class Encoding(NamedTuple):
+    name: str
+    format_line: Callable   # (card, show_number) -> line without the newline
+    suffix: str             # written after the cards
 
-def fetch_cards(db_path="pokemon_cards.db"):
-    conn = sqlite3.connect(db_path)
+def fetch_cards(db_path="pokemon_cards.db", catalog=None, regulations=LEGAL_REGULATIONS):
+    """Return the cards in ``regulations`` as dicts, with their parsed ``attack_list``/``ability_list``."""
+    if catalog is not None:
+        return catalog.select(set(regulations))
+    return list(iter_cards(db_path, regulations))
+
+def iter_cards(db_path="pokemon_cards.db", regulations=LEGAL_REGULATIONS):
+    """``fetch_cards`` read in batches, for one pass over many cards."""
+    conn = connect_reader(db_path)
     conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT name, set_name, types, number, hp, effect, abilities, attacks, retreat, evolve_from, rarity, card_type, vstar_power
-        FROM cards
-        WHERE regulation IN ('g', 'h', 'i', 'f')
-        ORDER BY set_name, CAST(number AS INTEGER)
-    """)
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    try:
+        cur = conn.execute(f"""
+            SELECT rowid AS card_id, {CARD_COLUMNS}
+            FROM cards
+            WHERE regulation IN (SELECT value FROM json_each(?))
+            ORDER BY set_name, CAST(number AS INTEGER), rowid
+        """, (json.dumps(list(regulations)),))
+        text_cur = conn.cursor()
+        while True:
+            rows = [dict(r) for r in cur.fetchmany(BATCH_SIZE)]
+            if not rows:
+                break
+            _attach_text(text_cur, rows)
+            yield from rows
+    finally:
+        conn.close()
+
+def _attach_text(cur, rows):
+    ids = [r['card_id'] for r in rows]
+    attacks = attacks_for(cur, ids)
+    abilities = abilities_for(cur, ids)
+    for r in rows:
+        r['attack_list'] = attacks.get(r['card_id'], [])
+        r['ability_list'] = abilities.get(r['card_id'], [])
 
 def rarity_index(rarity: str) -> int:
     """Return the index of a rarity in RARITIES_ORDER, or a large number if unknown."""
-    try:
-        return RARITIES_ORDER.index(rarity.lower())
-    except ValueError:
-        return len(RARITIES_ORDER)
+    rank = rarity_rank(rarity)
+    return rank if rank >= 0 else len(RARITIES_ORDER)
 
-def _shorten_energy_names(text: str) -> str:
+def shorten_energy_names(text: str) -> str:
     """Replace full energy names in any casing with their single-letter codes."""
-    for full, letter in ENERGY_TO_LETTER.items():
-        pattern = re.compile(rf'\b{full}\b', flags=re.IGNORECASE)
-        text = pattern.sub(letter, text)
-    return text
+    return ENERGY_RE.sub(lambda m: ENERGY_TO_LETTER[m.group(1).lower()], text)
 
-def write_cards_txt(cards, out_path="cards.txt"):
-    grouped = {}
-    for c in cards:
-        card_type = (c['card_type'] or '').lower()
-        if card_type == 'pokemon':
-            key = (c['name'], c['attacks'] or '')
-        else:
-            key = c['effect'] or None
-        if key is None:
-            grouped[key] = c
+def format_attack(attack: Attack) -> str:
+    """Compact ``cost:[..],name:..,effect:..,damage:{..}`` form used on the sheet."""
+    s = f"cost:[{','.join(attack.cost)}],name:{attack.name}"
+    if attack.effect:
+        s += f",effect:{attack.effect}"
+    if attack.damage:
+        s += f",damage:{{{attack.damage}}}"
+    return s
+
+class SheetBuilder:
+    """
+    Picks a sheet's cards as they are added in ``fetch_cards`` order: one per
+    functional card (see schema.functional_identity), lowest rarity wins.
+    """
+
+    def __init__(self):
+        self.grouped = {}
+
+    def add(self, c):
+        key = c['identity']
+        if key not in self.grouped:
+            self.grouped[key] = c
         else:
-            if key not in grouped:
-                grouped[key] = c
-            else:
-                if rarity_index(c['rarity']) < rarity_index(grouped[key]['rarity']):
-                    grouped[key] = c
-
-    selected = list(grouped.values())
-    selected.sort(key=lambda c: (c['card_type'] != 'pokemon', c['set_name'], c['number']))
-
-    name_set_counts = {}
-    for c in selected:
-        if (c['card_type'] or '').lower() == 'pokemon':
-            key = (c['name'], c['set_name'])
-            name_set_counts[key] = name_set_counts.get(key, 0) + 1
-
-    with open(out_path, 'w', encoding='utf-8') as f:
+            if rarity_index(c['rarity']) < rarity_index(self.grouped[key]['rarity']):
+                self.grouped[key] = c
+
+    def entries(self):
+        """
+        Yield ``(card, show_number)`` in sheet order; ``show_number`` is set
+        when other pokemon on the sheet share the card's name and set.
+        """
+        selected = list(self.grouped.values())
+        selected.sort(key=lambda c: (c['card_type'] != 'pokemon', c['set_name'], c['number']))
+
+        name_set_counts = {}
         for c in selected:
-            n = ''
-            found = False
-            for i in c['number'].upper():
-                if not i.isdigit():
-                    n += i
-                    continue
-                if not found and i == '0':
-                    continue
+            if (c['card_type'] or '').lower() == 'pokemon':
+                key = (c['name'], c['set_name'])
+                name_set_counts[key] = name_set_counts.get(key, 0) + 1
+
+        for c in selected:
+            yield c, name_set_counts.get((c['name'], c['set_name']), 0) > 1
+
+def sheet_cards(cards):
+    """``(card, show_number)`` for the sheet of the legal ``cards``, see ``SheetBuilder``."""
+    builder = SheetBuilder()
+    for c in cards:
+        builder.add(c)
+    return builder.entries()
+
+def sheet_name(c, show_number: bool) -> str:
+    """How the card is named on the sheet (and in the deck the model returns)."""
+    if c['card_type'] != 'pokemon':
+        return ' '.join(c['name'].split(' '))
+    base_name = f"{c['name']} {c['set_name'].upper().replace('PROMO_SWSH', 'SP')}"
+    if show_number:
+        n = ''
+        found = False
+        for i in c['number'].upper():
+            if not i.isdigit():
                 n += i
-                found = True
-
-            if c['card_type'] == 'pokemon':
-                base_name = f"{c['name']} {c['set_name'].upper().replace('PROMO_SWSH', 'SP')}"
-                if name_set_counts[(c['name'], c['set_name'])] > 1:
-                    base_name += f" {n}"
-                s = f"{base_name}|"
-            else:
-                s = f"{' '.join(c['name'].split(' '))}|"
-
-            if c['rarity'] == 'ace spec rare':
-                s += 'ace spec|'
-
-            if c['hp'] and c['hp'].lower() != 'none':
-                s += f"HP:{c['hp']}|"
-
-            if c['types'] and c['types'].lower() != 'none':
-                types_str = c['types'][2:-2]
-                types_clean = types_str.replace('"', '').replace("'", '')
-                short_types = ''.join(
-                    ENERGY_TO_LETTER.get(t.strip().lower(), t.strip()[0].upper())
-                    for t in types_clean.split(',') if t.strip()
-                )
-                s += f"T:{short_types}|"
-
-            if c['effect'] and c['effect'].lower() != 'none':
-                s += f"E:{c['effect']}|"
-
-            if c['vstar_power'] and c['vstar_power'].lower() != 'none':
-                s += f"V:{c['vstar_power']}|"
-
-            if c['abilities'] and c['abilities'].lower() != 'none':
-                ab = "'".join(c['abilities'].split("effect': '", 1)[1].split("'")[:-1])
-                s += f"AB:{ab}|"
-
-            if c['attacks'] and c['attacks'].lower() != 'none':
-                attacks = c['attacks'][2:-2]
-                attacks = (attacks.replace('}, {', '|')
-                                   .replace(", 'effect': none", '')
-                                   .replace("'amount': ", '')
-                                   .replace(", 'damage': none", '')
-                                   .replace(': ', ':')
-                                   .replace(', ', ',')
-                                   .replace("'", '')
-                                   .replace(",suffix:", ''))
-                
-                attacks = _shorten_energy_names(attacks)
-                s += f"A:{attacks}|"
-
-            if c['retreat'] is not None and str(c['retreat']).lower() not in ('none', '1'):
-                s += f"R:{c['retreat']}|"
-
-            if c['evolve_from'] and c['evolve_from'].lower() != 'none':
-                s += f"F:{c['evolve_from']}|"
-
-            f.write(s[:-1].replace('\n', '\\') + '\n')
-        f.write(SUFFIX)
+                continue
+            if not found and i == '0':
+                continue
+            n += i
+            found = True
+        base_name += f" {n}"
+    return base_name
+
+def short_types(c) -> str:
+    """The card's types as energy letters, e.g. ``LC``; '' if it has none."""
+    if not c['types'] or c['types'].lower() == 'none':
+        return ''
+    types_str = c['types'][2:-2]
+    types_clean = types_str.replace('"', '').replace("'", '')
+    return ''.join(
+        ENERGY_TO_LETTER.get(t.strip().lower(), t.strip()[0].upper())
+        for t in types_clean.split(',') if t.strip()
+    )
+
+def format_card(c, show_number: bool) -> str:
+    """The card's line on the sheet, without the newline."""
+    s = f"{sheet_name(c, show_number)}|"
+
+    if c['rarity'] == 'ace spec rare':
+        s += 'ace spec|'
+
+    if c['hp'] and c['hp'].lower() != 'none':
+        s += f"HP:{c['hp']}|"
+
+    types = short_types(c)
+    if types:
+        s += f"T:{types}|"
+
+    if c['effect'] and c['effect'].lower() != 'none':
+        s += f"E:{c['effect']}|"
+
+    if c['vstar_power'] and c['vstar_power'].lower() != 'none':
+        s += f"V:{c['vstar_power']}|"
+
+    for ability in c['ability_list']:
+        if ability.effect:
+            s += f"AB:{ability.effect}|"
+
+    if c['attack_list']:
+        attacks = '|'.join(format_attack(a) for a in c['attack_list'])
+        attacks = shorten_energy_names(attacks)
+        s += f"A:{attacks}|"
+
+    if c['retreat'] is not None and str(c['retreat']).lower() not in ('none', '1'):
+        s += f"R:{c['retreat']}|"
+
+    if c['evolve_from'] and c['evolve_from'].lower() != 'none':
+        s += f"F:{c['evolve_from']}|"
+
+    return s[:-1].replace('\n', '\\')
+
+PIPE = Encoding('pipe', format_card, SUFFIX)
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough LLM token count of ``text``, counted the way BPE tokenizers tend to
+    split it; good for comparing formats and budgets, not for exact limits.
+    """
+    return len(TOKEN_RE.findall(text))
+
+class SheetStats(NamedTuple):
+    cards: int          # lines written
+    formatted: int      # lines formatted by this run; 0 when the sheet was already current
+    tokens: int         # estimate_tokens of the whole sheet
+
+def _stamp_path(out_path: str) -> str:
+    return out_path + '.stamp'
+
+def current_sheet(out_path="cards.txt", source=None, encoding=PIPE) -> SheetStats | None:
+    """
+    The stats of ``out_path`` if it was last written by ``write_sheet`` from
+    ``source`` in this format, so it need not be rebuilt; None otherwise.
+    """
+    if source is None or not os.path.exists(out_path):
+        return None
+    try:
+        with open(_stamp_path(out_path), 'rb') as f:
+            key, (cards, tokens) = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if key != (LINE_FORMAT, encoding.name, source):
+        return None
+    return SheetStats(cards, 0, tokens)
+
+def write_sheet(entries, out_path="cards.txt", source=None, encoding=PIPE) -> SheetStats:
+    """
+    Stream ``(card, show_number)`` entries (``sheet_cards``) to ``out_path``
+    as they come.  ``source`` names the data they were picked from: the
+    ``database.signature`` taken before reading the cards, and the selection.
+    It is stamped next to the sheet for ``current_sheet``.
+    """
+    written = 0
+    tokens = estimate_tokens(encoding.suffix)
+    tmp = out_path + '.tmp'
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for c, show_number in entries:
+                text = encoding.format_line(c, show_number)
+                f.write(text + '\n')
+                written += 1
+                tokens += estimate_tokens(text)
+            f.write(encoding.suffix)
+        with suppress(FileNotFoundError):
+            os.remove(_stamp_path(out_path))
+        os.replace(tmp, out_path)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.remove(tmp)
+        raise
+    if source is not None:
+        stamp = _stamp_path(out_path)
+        with open(stamp + '.tmp', 'wb') as f:
+            marshal.dump(((LINE_FORMAT, encoding.name, source), (written, tokens)), f)
+        os.replace(stamp + '.tmp', stamp)
+    return SheetStats(written, written, tokens)
+
+def write_cards_txt(cards, out_path="cards.txt", source=None) -> SheetStats:
+    """Write the sheet for the legal ``cards`` (as from ``fetch_cards``); see ``write_sheet``."""
+    return write_sheet(sheet_cards(cards), out_path, source)
 
 if __name__ == "__main__":
-    cards = fetch_cards()
-    write_cards_txt(cards)
+    start = time.perf_counter()
+    source = (signature("pokemon_cards.db"), LEGAL_REGULATIONS)
+    stats = current_sheet(source=source) or write_cards_txt(iter_cards(), source=source)
+    print(f"Wrote {stats.cards} cards ({stats.formatted} reformatted, ~{stats.tokens} tokens) "
+          f"in {time.perf_counter() - start:.2f}s")
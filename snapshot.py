@@ -0,0 +1,207 @@
+"""
+Snapshot file for near-instant ``CardCatalog`` startup.
+
+``write_snapshot`` stores a catalog next to the database as a compact columnar
+file (``pokemon_cards.db.snap``): low-cardinality columns are dictionary-encoded
+and the whole body is a single ``marshal`` blob, so loading it is one read plus
+rebuilding the records.  The header records the source database's size, mtime
+and content hash, and the state of its write-ahead log; ``load_catalog`` falls
+back to the database and rewrites the snapshot whenever they no longer match.
+``CatalogSource`` shares one loaded catalog between concurrent readers
+(``service.py``, ``deck_batch.py``) and reloads it when the database is swapped.
+
+    python snapshot.py [pokemon_cards.db]
+"""
+import hashlib
+import marshal
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from typing import Iterator
+
+from card_text import Ability, Attack
+from catalog import COLUMNS, Card, CardCatalog
+from database import FileWatch, wal_state
+from schema import SCHEMA_VERSION
+
+DB_PATH = "pokemon_cards.db"
+
+MAGIC = b"TCGSNAP\0"
+SNAPSHOT_VERSION = 2
+_LENGTH = struct.Struct("<I")
+
+
+def snapshot_path(db_path: str) -> str:
+    return db_path + ".snap"
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_meta(db_path: str) -> dict:
+    st = os.stat(db_path)
+    return {
+        "snapshot_version": SNAPSHOT_VERSION,
+        "schema_version": SCHEMA_VERSION,
+        "columns": COLUMNS,
+        "db_size": st.st_size,
+        "db_mtime_ns": st.st_mtime_ns,
+        "db_hash": file_hash(db_path),
+        "wal": wal_state(db_path),
+    }
+
+
+def _encode_column(values: list) -> tuple:
+    distinct = list(dict.fromkeys(values))
+    if len(distinct) > len(values) // 2:
+        return ("plain", tuple(values))
+    codes = {v: i for i, v in enumerate(distinct)}
+    return ("dict", tuple(distinct), array("I", (codes[v] for v in values)).tobytes())
+
+
+def _decode_column(column: tuple) -> list:
+    if column[0] == "plain":
+        return list(column[1])
+    distinct = column[1]
+    codes = array("I")
+    codes.frombytes(column[2])
+    return [distinct[i] for i in codes]
+
+
+def write_snapshot(catalog: CardCatalog, db_path: str = DB_PATH, path: str | None = None) -> str:
+    path = path or snapshot_path(db_path)
+    cards = catalog.cards
+    body = {
+        "card_id": tuple(c.card_id for c in cards),
+        "columns": tuple(_encode_column([getattr(c, col) for c in cards]) for col in COLUMNS),
+        # NamedTuples are not marshallable, plain tuples are
+        "attacks": tuple(tuple(tuple(a) for a in c.attack_list) for c in cards),
+        "abilities": tuple(tuple(tuple(a) for a in c.ability_list) for c in cards),
+        "aliases": catalog.aliases,
+    }
+    meta = marshal.dumps(_source_meta(db_path))
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(_LENGTH.pack(len(meta)))
+        f.write(meta)
+        f.write(marshal.dumps(body))
+    os.replace(tmp, path)
+    return path
+
+
+def _read_meta(f) -> dict | None:
+    if f.read(len(MAGIC)) != MAGIC:
+        return None
+    (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+    return marshal.loads(f.read(length))
+
+
+def is_current(meta: dict, db_path: str) -> bool:
+    """Does the snapshot described by ``meta`` still match the database on disk?"""
+    if (meta.get("snapshot_version") != SNAPSHOT_VERSION
+            or meta.get("schema_version") != SCHEMA_VERSION
+            or tuple(meta.get("columns", ())) != COLUMNS):
+        return False
+    st = os.stat(db_path)
+    if st.st_size != meta["db_size"] or wal_state(db_path) != meta.get("wal"):
+        return False
+    if st.st_mtime_ns == meta["db_mtime_ns"]:
+        return True
+    # touched but possibly unchanged (copied, restored from backup, ...)
+    return file_hash(db_path) == meta["db_hash"]
+
+
+def read_snapshot(db_path: str = DB_PATH, path: str | None = None) -> CardCatalog | None:
+    """Load the snapshot for ``db_path``, or return None if it is missing or stale."""
+    path = path or snapshot_path(db_path)
+    try:
+        with open(path, "rb") as f:
+            meta = _read_meta(f)
+            if meta is None or not is_current(meta, db_path):
+                return None
+            body = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, struct.error):
+        return None
+
+    columns = [_decode_column(col) for col in body["columns"]]
+    cards = [
+        Card(
+            card_id,
+            values,
+            [Attack(*a) for a in attacks],
+            [Ability(*a) for a in abilities],
+        )
+        for card_id, values, attacks, abilities in zip(
+            body["card_id"], zip(*columns), body["attacks"], body["abilities"]
+        )
+    ]
+    return CardCatalog(cards, body["aliases"])
+
+
+def load_catalog(db_path: str = DB_PATH) -> CardCatalog:
+    """Catalog from the snapshot if it is current, otherwise from the database (refreshing the snapshot)."""
+    catalog = read_snapshot(db_path)
+    if catalog is None:
+        catalog = CardCatalog.load(db_path)
+        try:
+            write_snapshot(catalog, db_path)
+        except OSError as e:
+            sys.stderr.write(f"Warning: could not write snapshot: {e}\n")
+    return catalog
+
+
+class CatalogSource:
+    """
+    The shared in-memory catalog, handed out like ``database.ConnectionPool``
+    hands out cursors; lookups only read it, so no locking is needed.
+    Reloaded (and swapped in whole) after the database is replaced.
+    """
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        self._watch = FileWatch(db_path)
+        self._lock = threading.Lock()
+        self.catalog = load_catalog(db_path)
+
+    @contextmanager
+    def cursor(self) -> Iterator[CardCatalog]:
+        with self._lock:
+            if self._watch.changed():
+                self.catalog = load_catalog(self.db_path)
+        yield self.catalog
+
+    def close(self) -> None:
+        pass
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+
+    start = time.perf_counter()
+    catalog = CardCatalog.load(db_path)
+    path = write_snapshot(catalog, db_path)
+    written = time.perf_counter() - start
+
+    start = time.perf_counter()
+    loaded = read_snapshot(db_path)
+    elapsed = time.perf_counter() - start
+    if loaded is None or len(loaded) != len(catalog):
+        sys.exit(f"{path} did not read back")
+
+    print(f"Wrote {path} ({os.path.getsize(path) / 1024:.0f} KiB, {len(catalog)} cards) in {written * 1000:.0f} ms")
+    print(f"Snapshot loads in {elapsed * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
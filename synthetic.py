@@ -0,0 +1,216 @@
+"""
+Deterministic synthetic card databases and decklists, for benchmarks.
+
+``build_db`` writes a ``cards`` table shaped like the ingest's (the
+notebook's ``desired_order`` columns, every value normalized the same way)
+from generated documents, then runs ``schema.migrate`` over it, so every
+script can run against it without the upstream repo.  The same ``rows`` and
+``seed`` always give the same database.
+
+- functional cards are reprinted ~``REPRINTS`` times across sets and rarities,
+  first at a regular rarity
+- pairs of Pokémon share a name with different attacks, as real ones do
+- sets span regulation marks d to i, oldest first
+
+``decklists`` samples decks from a built database: PTCG Live exports for
+the search scripts and answer dicts for ``interpret``.
+
+    python synthetic.py out.db [--rows 10000] [--seed 1] [--decks 100 --decks-out decks.jsonl]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import date, timedelta
+
+import schema
+from ingest import normalize_value, ordered_columns
+from printing_rules import RARITIES_ORDER
+
+# bump when the generated data changes, so cached benchmark databases are rebuilt
+VERSION = 1
+REPRINTS = 4
+CARDS_PER_SET = 250
+FIRST_RELEASE = date(2019, 2, 1)
+REGULATIONS = "defghi"
+
+ENERGY_TYPES = ["Grass", "Fire", "Water", "Lightning", "Psychic", "Fighting", "Darkness", "Metal"]
+TRAINER_TYPES = [("Item", 0.45), ("Supporter", 0.35), ("Stadium", 0.12), ("Special Energy", 0.08)]
+POKEMON_SHARE = 0.6
+VERBS = ["Search", "Draw", "Discard", "Heal", "Switch", "Attach", "Shuffle", "Look at"]
+OBJECTS = ["a Basic Pokémon", "2 cards", "an Energy", "30 damage", "your Active Pokémon", "the top 3 cards"]
+
+COMMON_RARITIES = ["Common", "Uncommon", "Rare"]
+TRAINER_RARITIES = ["Common", "Uncommon", "Rare", "Ultra Rare", "Hyper Rare"]
+
+
+def _sentence(rng: random.Random) -> str:
+    return f"{rng.choice(VERBS)} {rng.choice(OBJECTS)}."
+
+
+def _functional_cards(count: int, rng: random.Random) -> list[dict]:
+    # every basic energy exists, so decks can always be completed
+    cards = [{"card_type": "Energy", "name": f"{energy} Energy"} for energy in ENERGY_TYPES]
+    for k in range(count - len(cards)):
+        if rng.random() < POKEMON_SHARE:
+            energy = rng.choice(ENERGY_TYPES)
+            attacks = [
+                {
+                    "cost": [energy] + ["Colorless"] * rng.randint(0, 2),
+                    "name": f"Attack {k}-{i}",
+                    "effect": _sentence(rng) if rng.random() < 0.5 else None,
+                    "damage": {"amount": 10 * rng.randint(1, 25), "suffix": rng.choice(["", "", "+", "×"])},
+                }
+                for i in range(rng.randint(1, 2))
+            ]
+            abilities = None
+            if rng.random() < 0.2:
+                abilities = [{"type": "Ability", "name": f"Ability {k}", "effect": _sentence(rng)}]
+            evolves = rng.random() < 0.4
+            cards.append({
+                "card_type": "Pokémon",
+                "name": f"Mon {k // 2}" + (" ex" if k % 10 == 9 else ""),
+                "types": [energy],
+                "hp": str(10 * rng.randint(4, 34)),
+                "stage": "Stage 1" if evolves else "Basic",
+                "evolve_from": f"Mon {k // 2 - 1}" if evolves and k > 1 else None,
+                "attacks": attacks,
+                "abilities": abilities,
+                "weakness": [rng.choice(ENERGY_TYPES)],
+                "retreat": str(rng.randint(0, 4)),
+                "vstar_power": "Star Burst" if k % 37 == 0 else None,
+                "rule_box": "Pokémon ex rule: When your Pokémon ex is Knocked Out, your opponent takes 2 Prize cards."
+                            if k % 10 == 9 else None,
+            })
+        else:
+            roll, card_type = rng.random(), TRAINER_TYPES[-1][0]
+            for t, share in TRAINER_TYPES:
+                if roll < share:
+                    card_type = t
+                    break
+                roll -= share
+            cards.append({"card_type": card_type, "name": f"Trainer {k}", "effect": _sentence(rng) + " " + _sentence(rng)})
+    return cards
+
+
+def generate(rows: int, seed: int = 1):
+    """The raw documents (as the upstream JSON has them) for a ``rows``-card database."""
+    rng = random.Random(seed)
+    functional = _functional_cards(max(50, rows // REPRINTS), rng)
+    set_count = max(8, rows // CARDS_PER_SET)
+    sets = []
+    for i in range(set_count):
+        released = FIRST_RELEASE + timedelta(days=int(i * 2000 / set_count))
+        sets.append({
+            "set_name": f"S{i:03d}",
+            "set_full_name": f"Synthetic Set {i}",
+            "set_code": f"syn{i}",
+            "date": released.strftime("%b %d, %Y"),
+            "regulation": REGULATIONS[i * len(REGULATIONS) // set_count].upper(),
+            "series": "Scarlet & Violet" if i >= set_count // 2 else "Sword & Shield",
+            "set_img": f"https://img.example/sets/S{i:03d}.png",
+        })
+    numbers = [0] * set_count
+
+    for n in range(rows):
+        card = functional[n] if n < len(functional) else rng.choice(functional)
+        s = rng.randrange(set_count)
+        numbers[s] += 1
+        number = f"{numbers[s]:03d}"
+        if n < len(functional) or card["card_type"] == "Energy":
+            # the first printing is a regular one, as in a main set
+            rarity = rng.choice(COMMON_RARITIES)
+        elif card["card_type"] == "Pokémon":
+            rarity = rng.choice(RARITIES_ORDER[:10]) if rng.random() < 0.3 else rng.choice(COMMON_RARITIES)
+        else:
+            rarity = "ACE SPEC Rare" if rng.random() < 0.02 else rng.choice(TRAINER_RARITIES)
+        yield {
+            **card,
+            **sets[s],
+            "number": number,
+            "rarity": rarity,
+            "set_total": str(CARDS_PER_SET),
+            "img": f"https://img.example/{sets[s]['set_name']}/{number}.png",
+            "rarity_img": f"https://img.example/rarity/{rarity.replace(' ', '_')}.png",
+            "url": f"https://cards.example/{sets[s]['set_name']}/{number}",
+        }
+
+
+def build_db(path: str, rows: int = 10000, seed: int = 1) -> str:
+    """Write the synthetic database to ``path`` (replacing it) and migrate it."""
+    docs = list(generate(rows, seed))
+    columns = ordered_columns({key for doc in docs for key, val in doc.items() if val is not None})
+
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            conn.execute(f"CREATE TABLE cards ({', '.join(f'{chr(34)}{c}{chr(34)} TEXT' for c in columns)})")
+            conn.executemany(
+                f"INSERT INTO cards VALUES ({', '.join('?' * len(columns))})",
+                ([normalize_value(col, doc.get(col)) for col in columns] for doc in docs),
+            )
+        schema.migrate(conn)
+    finally:
+        conn.close()
+    return path
+
+
+def decklists(conn: sqlite3.Connection, count: int, seed: int = 1) -> list[dict]:
+    """
+    ``count`` decks of legal printings as ``{"decklist": PTCG Live text,
+    "dict": interpret's answer dict}``.
+    """
+    rng = random.Random(seed)
+    legal = "SELECT name, set_name, number FROM cards WHERE regulation IN ('f', 'g', 'h', 'i') AND card_type = ?"
+    pokemon = conn.execute(legal, ("pokemon",)).fetchall()
+    trainers = [row for t in ("item", "supporter", "stadium") for row in conn.execute(legal, (t,))]
+    decks = []
+    for _ in range(count):
+        picks = {
+            "Pokemon": rng.sample(pokemon, min(len(pokemon), 8)),
+            "Trainer": rng.sample(trainers, min(len(trainers), 12)),
+        }
+        counts = {section: [rng.randint(1, 4) for _ in rows] for section, rows in picks.items()}
+        energy = ENERGY_TYPES[rng.randrange(len(ENERGY_TYPES))]
+        energy_count = max(1, 60 - sum(map(sum, counts.values())))
+
+        lines, answer = [], {}
+        for section, rows in picks.items():
+            lines.append(f"{section} - {sum(counts[section])}")
+            for (name, set_name, number), qty in zip(rows, counts[section]):
+                lines.append(f"{qty} {name.title()} {set_name.upper()} {number}")
+                key = f"{name} {set_name.upper()}" if section == "Pokemon" else name
+                answer[key] = [qty, section]
+        lines += [f"Energy - {energy_count}", f"{energy_count} Basic {energy} Energy Energy {ENERGY_TYPES.index(energy) + 1}"]
+        answer[f"{energy} Energy"] = [energy_count, "Energy"]
+        decks.append({"decklist": "\n".join(lines), "dict": answer})
+    return decks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a synthetic pokemon_cards.db")
+    parser.add_argument("db")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--decks", type=int, default=0, help="also write this many decklists")
+    parser.add_argument("--decks-out", default="decks.jsonl")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    build_db(args.db, args.rows, args.seed)
+    print(f"Built {args.db} ({args.rows} cards) in {time.perf_counter() - start:.1f}s")
+    if args.decks:
+        conn = sqlite3.connect(args.db)
+        with open(args.decks_out, "w", encoding="utf-8") as f:
+            for deck in decklists(conn, args.decks, args.seed):
+                f.write(json.dumps(deck, ensure_ascii=False) + "\n")
+        conn.close()
+        print(f"Wrote {args.decks} decklists to {args.decks_out}")
+
+
+if __name__ == "__main__":
+    main()
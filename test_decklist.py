@@ -0,0 +1,31 @@
+from decklist import iter_entries, parse_decklist
+
+
+def entries(*lines):
+    return [entry for entry in iter_entries(lines) if entry is not None]
+
+
+def test_basic_energy_line():
+    [entry] = entries("8 Basic {L} Energy Energy 4")
+    assert entry.kind == "energy"
+    assert entry.section == "Energy"
+    assert entry.quantity == 8
+    assert entry.name == "Basic {L} Energy"
+
+
+def test_plain_energy_named_trainers():
+    switch, retrieval = entries("Trainer - 5", "3 Energy Switch", "2 Energy Retrieval")
+    assert (switch.quantity, switch.name, switch.kind, switch.section) == (3, "Energy Switch", "name", "Trainer")
+    assert (retrieval.quantity, retrieval.name, retrieval.kind) == (2, "Energy Retrieval", "name")
+
+
+def test_energy_named_trainer_printing():
+    [entry] = entries("3 Energy Switch SVI 173")
+    assert entry.kind == "printing"
+    assert (entry.name, entry.set_code, entry.number) == ("Energy Switch", "SVI", "173")
+
+
+def test_parse_decklist_keeps_energy_named_trainers():
+    printings, basic_energies = parse_decklist(["3 Energy Switch SVI 173", "8 Basic Lightning Energy Energy 4"])
+    assert [entry.name for entry in printings] == ["Energy Switch"]
+    assert basic_energies == ["8 Basic Lightning Energy Energy 4"]
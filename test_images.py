@@ -0,0 +1,86 @@
+import functools
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from images import HttpFetcher, ImageCache
+
+
+class Handler(SimpleHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/truncated.png":
+            # promises more bytes than it sends, then hangs up
+            self.send_response(200)
+            self.send_header("Content-Length", "1000")
+            self.end_headers()
+            self.wfile.write(b"partial")
+            self.close_connection = True
+            return
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path):
+    root = tmp_path / "www"
+    (root / "cards").mkdir(parents=True)
+    (root / "cards" / "pikachu.png").write_bytes(b"pikachu image")
+    (root / "cards" / "raichu.png").write_bytes(b"raichu image")
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(Handler, directory=str(root)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def cache(tmp_path, server):
+    cache = ImageCache(str(tmp_path / "cache"), fetcher=HttpFetcher(timeout=5, base_url=server), workers=2)
+    yield cache
+    cache.close()
+
+
+def leftovers(cache):
+    return [name for _, _, files in os.walk(os.path.join(cache.root, "objects")) for name in files
+            if name.endswith(".tmp")]
+
+
+def test_fresh_download(cache):
+    url = "https://images.example/cards/pikachu.png?v=1"
+    report = cache.fetch([url, url])
+    assert report.fetched == 1
+    assert report.failed == {}
+    with open(report.paths[url], "rb") as f:
+        assert f.read() == b"pikachu image"
+
+
+def test_cached_hit(cache):
+    urls = ["https://images.example/cards/pikachu.png", "https://images.example/cards/raichu.png"]
+    first = cache.fetch(urls[:1])
+    second = cache.fetch(urls)
+    assert second.fetched == 1
+    assert second.paths[urls[0]] == first.paths[urls[0]]
+    third = cache.fetch(urls)
+    assert third.fetched == 0
+    assert third.paths == second.paths
+    assert cache.stats()["files"] == 2
+
+
+def test_http_error_and_partial_file(cache):
+    missing = "https://images.example/cards/missing.png"
+    truncated = "https://images.example/truncated.png"
+    good = "https://images.example/cards/raichu.png"
+    report = cache.fetch([missing, truncated, good])
+    assert set(report.failed) == {missing, truncated}
+    assert "404" in report.failed[missing]
+    assert report.fetched == 1
+    assert list(report.paths) == [good]
+    assert leftovers(cache) == []
+    assert cache.stats()["files"] == 1
+    # nothing about the failures was cached, so they are tried again
+    assert set(cache.fetch([missing, truncated]).failed) == {missing, truncated}